@@ -0,0 +1,106 @@
+from hashlib import sha256
+from os import getpid, listdir, makedirs, remove, rename, utime
+from os.path import getmtime, getsize, isdir, isfile, join
+import pickle
+from shutil import copyfile
+
+
+def file_digest(filename):
+    # the sha256 of a file's contents, for keying on a file's content instead of its name
+    digest = sha256()
+    with open(filename, "rb") as source:
+        for block in iter(lambda: source.read(2 ** 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class RenderCache(object):
+    """
+    a content-addressed cache of objects and files on disk. Each entry is stored under
+    the hash of its key, which should hold everything the entry depends on. Reading an
+    entry marks it as recently used, and once the cache holds more than max_size bytes
+    the least recently used entries are removed.
+    """
+    def __init__(self, folder="cache", max_size=512 * 2 ** 20):
+        self.folder = folder
+        self.max_size = max_size
+        if not isdir(self.folder):
+            makedirs(self.folder)
+
+    def entry(self, key, suffix):
+        return join(self.folder, sha256(repr(key).encode("utf-8")).hexdigest() + suffix)
+
+    def temporary(self, entry):
+        # entries are written to a file of their own first, so that other processes never
+        # read one that is half written
+        return "{}.{}.tmp".format(entry, getpid())
+
+    def hit(self, entry):
+        if not isfile(entry):
+            return False
+        try:
+            utime(entry, None)
+        except OSError:
+            # evicted by another process in the meantime
+            return False
+        return True
+
+    def get_object(self, key):
+        # the object stored under key, or None if there isn't one
+        entry = self.entry(key, ".pickle")
+        if not self.hit(entry):
+            return None
+        try:
+            with open(entry, "rb") as stored:
+                return pickle.load(stored)
+        except (IOError, OSError):
+            # evicted by another process in the meantime
+            return None
+
+    def put_object(self, key, value):
+        entry = self.entry(key, ".pickle")
+        temporary = self.temporary(entry)
+        with open(temporary, "wb") as stored:
+            pickle.dump(value, stored, pickle.HIGHEST_PROTOCOL)
+        rename(temporary, entry)
+        self.evict()
+
+    def get_file(self, key, filename):
+        # copy the file stored under key to filename, returning whether there was one
+        entry = self.entry(key, "." + filename.split(".")[-1])
+        if not self.hit(entry):
+            return False
+        try:
+            copyfile(entry, filename)
+        except (IOError, OSError):
+            return False
+        return True
+
+    def put_file(self, key, filename):
+        entry = self.entry(key, "." + filename.split(".")[-1])
+        temporary = self.temporary(entry)
+        copyfile(filename, temporary)
+        rename(temporary, entry)
+        self.evict()
+
+    def evict(self):
+        # remove the least recently used entries until the cache fits in max_size
+        entries = [join(self.folder, name) for name in listdir(self.folder)
+                   if not name.endswith(".tmp")]
+        stats = []
+        for entry in entries:
+            try:
+                stats.append((getmtime(entry), getsize(entry), entry))
+            except OSError:
+                # removed by another process since it was listed
+                pass
+        entries = sorted(stats)
+        total = sum([size for _, size, _ in entries])
+        for _, size, entry in entries:
+            if total <= self.max_size:
+                break
+            try:
+                remove(entry)
+            except OSError:
+                pass
+            total -= size
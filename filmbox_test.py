@@ -0,0 +1,51 @@
+# check that meshes without edges inside their pieces can be written as outlines with seams,
+# and that relative indices count back from the vertices read before their face
+from os import chdir
+from os.path import isfile
+from tempfile import mkdtemp
+
+from svgpathtools import svg2paths
+
+from filmbox_to_pattern import flatten_job, load_obj
+
+obj = """o triangle
+v 0 0 0
+v 1 0 0
+v 0 1 0
+f 1 2 3
+o bowtie
+v 0 0 1
+v 1 0 1
+v 1 1 1
+v 2 1 1
+v 2 0 1
+f 4 5 6
+f 6 7 8
+o interleaved
+v 0 0 2
+v 1 0 2
+v 0 1 2
+f -3 -2 -1
+v 3 0 2
+v 4 0 2
+v 3 1 2
+f -3 -2 -1
+"""
+
+chdir(mkdtemp(prefix="filmbox_test"))
+with open("pieces.obj", "w") as obj_file:
+    obj_file.write(obj)
+meshes = load_obj("pieces.obj")
+# the two triangles of the interleaved object are apart, rather than both the last three
+# vertices of the file
+assert len(meshes[2].vertices) == 6, meshes[2]
+assert meshes[2].vertices[meshes[2].triangles][:, 0].tolist() == [[0, 0, 2], [3, 0, 2]], \
+    meshes[2]
+for mesh in meshes:
+    result = flatten_job((mesh, False, {'outline': True, 'seams': True}))
+    assert result['error'] is None, result['error']
+    assert isfile(result['filename']), result['filename']
+    paths, attributes = svg2paths(result['filename'])
+    # just the outline, of each triangle
+    assert len(paths) == 1 and len(paths[0]) == 3 * len(mesh.triangles), paths
+    print("{}: {}".format(mesh.name, paths[0].d()))
@@ -1,28 +1,88 @@
-# install Autodesk FBX python extensions from here:
-# https://www.autodesk.com/developer-network/platform-technologies/fbx-sdk-2019-0
-from FbxCommon import *
+from collections import namedtuple
 import argparse
+from multiprocessing import Pool
+from os.path import splitext
+import re
+from time import time
 
-# does not work with python >3.3
-from math import acos, cos, sin
-
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 from svgwrite import Drawing, rgb
-from svgpathtools import Path, Line
-
 
-from utils import calc_overall_bbox
+try:
+    # install Autodesk FBX python extensions from here:
+    # https://www.autodesk.com/developer-network/platform-technologies/fbx-sdk-2019-0
+    # does not work with python >3.3, and is only needed for fbx files
+    from FbxCommon import *
+except ImportError:
+    InitializeSdkObjects = None
 
 parser = argparse.ArgumentParser(
     description='Generate a sewing pattern from an AutoDesk Filmbox file')
 parser.add_argument('--fbx', type=str, help='The filename filmbox file.')
+parser.add_argument('--filename', type=str,
+                    help='The filename of the mesh to flatten, an fbx, obj or binary ply file.')
+parser.add_argument('--jobs', type=int, default=1,
+                    help="The number of processes to flatten the meshes with.")
+parser.add_argument('--layout', type=str,
+                    help="Also write all of the flattened meshes side by side to this svg.")
+parser.add_argument('--outline', action='store_true',
+                    help="Write the outline of each piece as a single path, instead of a "
+                         "path for every triangle.")
+parser.add_argument('--seams', action='store_true',
+                    help="With --outline, also write the edges inside the pieces, each once, "
+                         "as a second layer.")
+
+# the positions of a mesh's vertices as an (n, 3) array, and the corners of its triangles
+# as an (F, 3) array of indices into them
+Mesh = namedtuple("Mesh", ["name", "vertices", "triangles"])
+
+# the numpy types of the types of ply properties
+ply_types = {"char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1", "short": "i2",
+             "int16": "i2", "ushort": "u2", "uint16": "u2", "int": "i4", "int32": "i4",
+             "uint": "u4", "uint32": "u4", "float": "f4", "float32": "f4", "double": "f8",
+             "float64": "f8"}
+
+
+def fan_triangles(polygon_vertices, sizes):
+    """
+    split polygons, given as all of their corners one after the other and the number of
+    corners of each, into triangles fanning out from their first corner
+    """
+    starts = np.cumsum(sizes) - sizes
+    fans = np.maximum(sizes - 2, 0)
+    polygons = np.repeat(np.arange(len(sizes)), fans)
+    # the number of each triangle within its polygon
+    steps = np.arange(fans.sum()) - np.repeat(np.cumsum(fans) - fans, fans)
+    firsts = starts[polygons]
+    return np.stack([polygon_vertices[firsts], polygon_vertices[firsts + steps + 1],
+                     polygon_vertices[firsts + steps + 2]], axis=1)
+
+
+def mesh_arrays(lMesh):
+    """
+    the positions of a mesh's control points as an (n, 3) array, and the corners of its
+    triangles as an (F, 3) array of indices into them
+    """
+    vertices = np.array([[point[0], point[1], point[2]]
+                         for point in lMesh.GetControlPoints()], dtype=float)
+    polygon_vertices = np.array(lMesh.GetPolygonVertices(), dtype=int)
+    polygon_count = lMesh.GetPolygonCount()
+    if len(polygon_vertices) == 3 * polygon_count:
+        return vertices, polygon_vertices.reshape(-1, 3)
+    sizes = np.array([lMesh.GetPolygonSize(polygon_num)
+                      for polygon_num in range(polygon_count)], dtype=int)
+    return vertices, fan_triangles(polygon_vertices, sizes)
 
 
-def flatten_scene(pScene):
+def fbx_meshes(pScene):
     lNode = pScene.GetRootNode()
 
     if not lNode:
-        return
+        return []
 
+    meshes = []
     for i in range(lNode.GetChildCount()):
 
         lChildNode = lNode.GetChild(i)
@@ -31,58 +91,477 @@ def flatten_scene(pScene):
         lAttributeType = (lChildNode.GetNodeAttribute().GetAttributeType())
         if lAttributeType != FbxNodeAttribute.eMesh:
             continue
-        lMesh = lChildNode.GetNodeAttribute()
-        projected_points = {}
-        control_points = lMesh.GetControlPoints()
-        start_point = 0
-        poly_paths = []
-        for polygon_num in range(lMesh.GetPolygonCount()):
-            corners = []
-            for corner in range(3):
-                corners.append(lMesh.GetPolygonVertex(polygon_num, corner))
-            # first, check if any of the control points are already projected
-            flattened = []
-            for j, corner in enumerate(corners):
-                if corner in projected_points:
-                    flattened.append(projected_points[corner])
-                    continue
-                target_corner = corners[j-1]
-                current_vec = control_points[corner]
-                target_vec = control_points[target_corner]
-                angle = acos(current_vec.DotProduct(target_vec)/(current_vec.Length()*target_vec.Length()))
-                length = current_vec.Distance(target_vec)
-                # find where the last point was. If it doesn't exist, use the start point
-                start_corner = projected_points[target_corner] \
-                    if target_corner in projected_points else start_point
-                flattened_corner = start_corner + length*(cos(angle)+1j*sin(angle))
-                projected_points[corner] = flattened_corner
-                start_point = flattened_corner
-                flattened.append(flattened_corner)
-            poly_paths.append(Path(*[Line(start=flattened[j], end=flattened[j-1])
-                                     for j in range(3)]))
-
-        dwg = Drawing("mesh{}.svg".format(i), profile='tiny')
-        for poly_path in poly_paths:
-            dwg.add(dwg.path(**{'d': poly_path.d(), 'fill': "none", 'stroke-width': 4,
-                            'stroke': rgb(0, 0, 0)}))
-        bbox = calc_overall_bbox(poly_paths)
-        width, height = abs(bbox[1] - bbox[0]), abs(bbox[3] - bbox[2])
-        dwg.viewbox(min(bbox[0], bbox[1]), min(bbox[2], bbox[3]), width, height)
-        dwg.save()
+        meshes.append(Mesh("mesh{}".format(i), *mesh_arrays(lChildNode.GetNodeAttribute())))
+    return meshes
 
 
-if __name__ == "__main__":
-    args = parser.parse_args()
+def load_fbx(filename):
+    if InitializeSdkObjects is None:
+        raise ImportError("reading fbx files needs the Autodesk FBX python extensions")
     # Prepare the FBX SDK.
     lSdkManager, lScene = InitializeSdkObjects()
+    try:
+        if not LoadScene(lSdkManager, lScene, filename):
+            raise ValueError("An error occurred while loading the scene...")
+        return fbx_meshes(lScene)
+    finally:
+        # Destroy all objects created by the FBX SDK.
+        lSdkManager.Destroy()
+
+
+def obj_faces(face_lines, vertex_counts):
+    """
+    the triangles of the text after the f of obj face lines, as indices from 0.
+    vertex_counts is the number of vertices read before each line, which its negative
+    indices count back from
+    """
+    # the lines are split by 0s, which obj indices never are
+    text = b" 0 ".join(face_lines)
+    tokens = np.array(text.split())
+    if b"/" in text:
+        # cut the texture and normal indices off of each corner
+        chars = tokens.view(np.uint8).reshape(len(tokens), -1)
+        slashes = chars == ord("/")
+        cuts = np.where(slashes.any(axis=1), slashes.argmax(axis=1), chars.shape[1])
+        chars[np.arange(chars.shape[1]) >= cuts[:, None]] = 0
+    indices = tokens.astype(int)
+    separators = np.flatnonzero(indices == 0)
+    sizes = np.diff(np.concatenate([[-1], separators, [len(indices)]])) - 1
+    indices = np.delete(indices, separators)
+    # negative indices count back from the last vertex before their line
+    counts = np.repeat(vertex_counts, sizes)
+    indices = np.where(indices < 0, indices + counts, indices - 1)
+    return fan_triangles(indices, sizes)
+
+
+def load_obj(filename):
+    """
+    the objects in a wavefront obj file as Meshes. The vertex and face lines are picked
+    out of the whole file with regular expressions and converted to arrays in bulk.
+    """
+    with open(filename, "rb") as obj_file:
+        data = obj_file.read()
+    # faces before the first object are a mesh of their own
+    chunks = re.split(br"^o[ \t][^\n]*\n", data, flags=re.M)
+    vertices = []
+    faces = []
+    num_vertices = 0
+    for chunk in chunks:
+        vertex_matches = list(re.finditer(br"^v[ \t]+([^\n]*)", chunk, flags=re.M))
+        face_matches = list(re.finditer(br"^f[ \t]+([^\n]*)", chunk, flags=re.M))
+        if face_matches:
+            # vertices and faces can be interleaved, so the vertices before each face
+            # line are counted from where the lines are in the chunk
+            vertex_counts = num_vertices + np.searchsorted(
+                [match.start() for match in vertex_matches],
+                [match.start() for match in face_matches])
+            faces.append(obj_faces([match.group(1) for match in face_matches],
+                                   vertex_counts))
+        if vertex_matches:
+            vertex_lines = [match.group(1) for match in vertex_matches]
+            values = np.array(b" ".join(vertex_lines).split(), dtype=float)
+            vertices.append(values.reshape(len(vertex_lines), -1)[:, :3])
+            num_vertices += len(vertex_lines)
+    vertices = np.concatenate(vertices) if vertices else np.zeros((0, 3))
+    meshes = []
+    for triangles in faces:
+        # each mesh only keeps the vertices its triangles use
+        used, triangles = np.unique(triangles, return_inverse=True)
+        meshes.append(Mesh("mesh{}".format(len(meshes)), vertices[used],
+                           triangles.reshape(-1, 3)))
+    return meshes
+
+
+def ply_header(ply_file):
+    # the format of a ply file and its elements, as (name, count, properties)
+    lines = []
+    while not lines or lines[-1][:1] != ["end_header"]:
+        line = ply_file.readline()
+        if not line:
+            raise ValueError("the ply header has no end")
+        lines.append(line.decode("ascii").split())
+    if lines[0] != ["ply"]:
+        raise ValueError("not a ply file")
+    file_format = None
+    elements = []
+    for words in lines[1:]:
+        if words[:1] == ["format"]:
+            file_format = words[1]
+        elif words[:1] == ["element"]:
+            elements.append((words[1], int(words[2]), []))
+        elif words[:1] == ["property"]:
+            # ("list", name, count type, item type) or (name, type)
+            elements[-1][2].append(("list", words[4], words[2], words[3])
+                                   if words[1] == "list" else (words[2], words[1]))
+    return file_format, elements
+
+
+def ply_dtype(properties, endian, list_length=None):
+    # the numpy dtype of an element, with list_length items in each list
+    fields = []
+    for prop in properties:
+        if prop[0] == "list":
+            fields.append((prop[1] + "_count", endian + ply_types[prop[2]]))
+            fields.append((prop[1], endian + ply_types[prop[3]], (list_length,)))
+        else:
+            fields.append((prop[0], endian + ply_types[prop[1]]))
+    return np.dtype(fields)
+
+
+def ply_polygons(data, properties, endian, count):
+    """
+    the corners of each face of a binary ply file, one after the other, and the number of
+    corners of each, from the bytes of the face element
+    """
+    lists = [prop for prop in properties if prop[0] == "list"]
+    indices_name, count_type = lists[0][1], endian + ply_types[lists[0][2]]
+    # most meshes have the same number of corners on every face, which makes the faces
+    # a fixed size and lets them all be read at once
+    skip = ply_dtype(properties[:properties.index(lists[0])], endian)
+    list_length = int(np.frombuffer(data, count_type, 1, skip.itemsize)[0]) if count else 0
+    dtype = ply_dtype(properties, endian, list_length)
+    if len(lists) == 1 and dtype.itemsize * count <= len(data):
+        faces = np.frombuffer(data, dtype, count)
+        if (faces[indices_name + "_count"] == list_length).all():
+            return faces[indices_name].ravel(), faces[indices_name + "_count"].astype(int)
+    polygons, sizes = [], []
+    offset = 0
+    for _ in range(count):
+        for prop in properties:
+            if prop[0] != "list":
+                offset += np.dtype(ply_types[prop[1]]).itemsize
+                continue
+            size = int(np.frombuffer(data, endian + ply_types[prop[2]], 1, offset)[0])
+            offset += np.dtype(ply_types[prop[2]]).itemsize
+            items = np.frombuffer(data, endian + ply_types[prop[3]], size, offset)
+            offset += items.nbytes
+            if prop[1] == indices_name:
+                polygons.append(items)
+                sizes.append(size)
+    return np.concatenate(polygons), np.array(sizes, dtype=int)
+
+
+def load_ply(filename):
+    """
+    a binary ply file as a Mesh. The vertices are memory mapped straight from the file,
+    as are the faces when they all have the same number of corners.
+    """
+    with open(filename, "rb") as ply_file:
+        file_format, elements = ply_header(ply_file)
+        offset = ply_file.tell()
+    if file_format not in ("binary_little_endian", "binary_big_endian"):
+        raise ValueError("only binary ply files can be read, not {}".format(file_format))
+    endian = "<" if file_format == "binary_little_endian" else ">"
+    vertices = triangles = None
+    for name, count, properties in elements:
+        if any(prop[0] == "list" for prop in properties):
+            if name != "face":
+                raise ValueError("can't read the {} element of a ply file".format(name))
+            data = np.memmap(filename, np.uint8, mode="r", offset=offset)
+            triangles = fan_triangles(*ply_polygons(data, properties, endian, count))
+            break
+        dtype = ply_dtype(properties, endian)
+        if name == "vertex" and count:
+            element = np.memmap(filename, dtype, mode="r", offset=offset, shape=(count,))
+            vertices = np.stack([element["x"], element["y"], element["z"]],
+                                axis=1).astype(float)
+        offset += dtype.itemsize * count
+    if vertices is None or triangles is None:
+        raise ValueError("the ply file has no vertices or faces")
+    return [Mesh("mesh0", vertices, triangles.astype(int))]
+
+
+# how to read each kind of mesh file
+loaders = {".fbx": load_fbx, ".obj": load_obj, ".ply": load_ply}
+
+
+def load_meshes(filename):
+    extension = splitext(filename)[1].lower()
+    if extension not in loaders:
+        raise ValueError("can't read {} files".format(extension))
+    return loaders[extension](filename)
+
+
+def half_edges(triangles):
+    """
+    the twin of each half-edge of a mesh, or -1 for edges on the boundary (or shared by
+    more than two triangles). Half-edge 3 * t + j runs from corner j of triangle t to the
+    corner after it, so the triangle of a half-edge h is h // 3.
+    """
+    num_vertices = triangles.max() + 1 if len(triangles) else 0
+    starts = triangles.ravel()
+    ends = triangles[:, [1, 2, 0]].ravel()
+    keys = np.minimum(starts, ends).astype(np.int64) * num_vertices + np.maximum(starts, ends)
+    order = np.argsort(keys, kind='stable')
+    # once sorted by edge, the edges shared by two triangles are runs of two equal keys
+    same = keys[order][1:] == keys[order][:-1]
+    pairs = np.nonzero(same & ~np.append(False, same[:-1]) & ~np.append(same[1:], False))[0]
+    twins = -np.ones(len(keys), dtype=int)
+    twins[order[pairs]] = order[pairs + 1]
+    twins[order[pairs + 1]] = order[pairs]
+    return twins
+
 
-    lResult = LoadScene(lSdkManager, lScene, args.fbx)
+def triangle_shapes(vertices, triangles):
+    # each triangle's corners in a plane, with corner 0 at the origin and corner 1 on the x axis
+    corners = vertices[triangles]
+    l01 = np.linalg.norm(corners[:, 1] - corners[:, 0], axis=1)
+    l02 = np.linalg.norm(corners[:, 2] - corners[:, 0], axis=1)
+    l12 = np.linalg.norm(corners[:, 2] - corners[:, 1], axis=1)
+    x = np.where(l01 > 0, (l01 ** 2 + l02 ** 2 - l12 ** 2) / (2 * np.where(l01 > 0, l01, 1)), 0)
+    y = np.sqrt(np.maximum(l02 ** 2 - x ** 2, 0))
+    return np.stack([np.zeros(len(triangles)), l01, x + 1j * y], axis=1)
 
-    if not lResult:
-        print("\n\nAn error occurred while loading the scene...")
+
+def flatten_triangles(vertices, triangles, twins=None):
+    """
+    unfold a mesh into the plane, returning the flattened corners of each triangle as an
+    (F, 3) complex array. Each connected piece of the mesh is unfolded breadth first from
+    its first triangle, placing each triangle against the edge it shares with the
+    triangle it was reached from, a whole ring of triangles at a time. The pieces are
+    laid out side by side.
+    """
+    if twins is None:
+        twins = half_edges(triangles)
+    num_triangles = len(triangles)
+    shapes = triangle_shapes(vertices, triangles)
+    boundary = twins < 0
+    neighbours = csr_matrix((np.ones(np.count_nonzero(~boundary)),
+                             (np.nonzero(~boundary)[0] // 3, twins[~boundary] // 3)),
+                            shape=(num_triangles, num_triangles))
+    _, pieces = connected_components(neighbours, directed=False)
+    _, frontier = np.unique(pieces, return_index=True)
+
+    flattened = np.zeros((num_triangles, 3), dtype=complex)
+    flattened[frontier] = shapes[frontier]
+    placed = np.zeros(num_triangles, dtype=bool)
+    placed[frontier] = True
+    while len(frontier):
+        edges = (3 * frontier[:, None] + np.arange(3)).ravel()
+        edges = edges[twins[edges] >= 0]
+        edges = edges[~placed[twins[edges] // 3]]
+        # a triangle reached from more than one side is placed against the first
+        children, first = np.unique(twins[edges] // 3, return_index=True)
+        edges = edges[first]
+        parents, corner = edges // 3, edges % 3
+        start = flattened[parents, corner]
+        end = flattened[parents, (corner + 1) % 3]
+        opposite = flattened[parents, (corner + 2) % 3]
+        # the corners of the child on the shared edge, and the one across from it
+        child_start = np.argmax(triangles[children] == triangles[parents, corner][:, None],
+                                axis=1)
+        child_end = np.argmax(triangles[children] ==
+                              triangles[parents, (corner + 1) % 3][:, None], axis=1)
+        child_other = 3 - child_start - child_end
+        rows = np.arange(len(children))
+        shape = shapes[children]
+        direction = shape[rows, child_end] - shape[rows, child_start]
+        rotation = (end - start) / np.where(direction != 0, direction, 1)
+        rotation /= np.where(rotation != 0, np.abs(rotation), 1)
+        placement = start[:, None] + (shape - shape[rows, child_start][:, None]) * \
+            rotation[:, None]
+        # mirror the child across the edge if it landed on the same side as its parent,
+        # as it does when the two are wound in opposite directions
+        edge = (end - start) / np.where(end != start, np.abs(end - start), 1)
+        side = ((placement[rows, child_other] - start) * edge.conjugate()).imag
+        same_side = side * ((opposite - start) * edge.conjugate()).imag > 0
+        mirrored = start[:, None] + ((placement - start[:, None]) /
+                                     edge[:, None]).conjugate() * edge[:, None]
+        placement = np.where(same_side[:, None], mirrored, placement)
+        placement[rows, child_start] = start
+        placement[rows, child_end] = end
+        flattened[children] = placement
+        placed[children] = True
+        frontier = children
+
+    return side_by_side(flattened, pieces)
+
+
+def side_by_side(corners, pieces):
+    # move the pieces of an (F, 3) complex array of triangles, numbered from 0 by pieces,
+    # into a row from left to right, a tenth of the tallest piece apart
+    num_pieces = pieces.max() + 1
+    bounds = []
+    for values in (corners.real, corners.imag):
+        low, high = np.full(num_pieces, np.inf), np.full(num_pieces, -np.inf)
+        np.minimum.at(low, pieces, values.min(axis=1))
+        np.maximum.at(high, pieces, values.max(axis=1))
+        bounds.append((low, high))
+    (left, right), (top, bottom) = bounds
+    gap = 0.1 * (bottom - top).max()
+    lefts = np.cumsum(np.append(0, right[:-1] - left[:-1] + gap))
+    return corners + (lefts - left - 1j * top)[pieces][:, None]
+
+
+def pattern_drawing(filename, corners):
+    # a drawing with its viewbox around an (F, 3) complex array of flattened triangles
+    dwg = Drawing(filename, profile='tiny')
+    width = corners.real.max() - corners.real.min()
+    height = corners.imag.max() - corners.imag.min()
+    dwg.viewbox(corners.real.min(), corners.imag.min(), width, height)
+    return dwg
+
+
+def save_triangles(filename, corners):
+    # write an (F, 3) complex array of flattened triangles to an svg, one path each
+    dwg = pattern_drawing(filename, corners)
+    for first, second, third in corners.tolist():
+        d = "M {},{} L {},{} L {},{} Z".format(first.real, first.imag, third.real,
+                                               third.imag, second.real, second.imag)
+        dwg.add(dwg.path(**{'d': d, 'fill': "none", 'stroke-width': 4,
+                            'stroke': rgb(0, 0, 0)}))
+    dwg.save()
+
+
+def pattern_edges(corners, tolerance=None):
+    """
+    the edges of flattened triangles, drawn once each, as the points at their ends and
+    pairs of indices into them. Corners within tolerance (a billionth of the size of the
+    pattern by default) are the same point. Returns the points, the outline edges (which
+    only one triangle has), and the edges inside the pieces (which two or more have).
+    """
+    points = corners.ravel()
+    if tolerance is None:
+        tolerance = 1e-9 * max(np.ptp(points.real), np.ptp(points.imag), 1)
+    grid = np.stack([np.round(points.real / tolerance), np.round(points.imag / tolerance)],
+                    axis=1)
+    _, first, ids = np.unique(grid, axis=0, return_index=True, return_inverse=True)
+    ids = ids.reshape(corners.shape)
+    starts, ends = ids.ravel(), ids[:, [1, 2, 0]].ravel()
+    keys = np.minimum(starts, ends).astype(np.int64) * len(first) + np.maximum(starts, ends)
+    keys, counts = np.unique(keys[starts != ends], return_counts=True)
+    edges = np.stack([keys // len(first), keys % len(first)], axis=1)
+    return points[first], edges[counts == 1], edges[counts > 1]
+
+
+def edge_chains(edges):
+    """
+    join edges, as pairs of point indices, into chains that run end to end, as lists of
+    point indices. Chains start at points with an odd number of edges where there are any,
+    so that open chains are followed from one end.
+    """
+    incident = {}
+    for edge, (start, end) in enumerate(edges.tolist()):
+        incident.setdefault(start, []).append(edge)
+        incident.setdefault(end, []).append(edge)
+    used = np.zeros(len(edges), dtype=bool)
+    starts = [point for point in incident if len(incident[point]) % 2] + list(incident)
+    chains = []
+    for point in starts:
+        while any(not used[edge] for edge in incident[point]):
+            chain = [point]
+            while True:
+                unused = [edge for edge in incident[chain[-1]] if not used[edge]]
+                if not unused:
+                    break
+                used[unused[0]] = True
+                start, end = edges[unused[0]]
+                chain.append(end if start == chain[-1] else start)
+            chains.append(chain)
+    return chains
+
+
+def chains_d(points, chains):
+    # the path data of chains of points, closing the ones that end where they start
+    d = []
+    for chain in chains:
+        closed = len(chain) > 2 and chain[0] == chain[-1]
+        coordinates = points[chain[:-1] if closed else chain].tolist()
+        d.append("M " + " L ".join("{},{}".format(point.real, point.imag)
+                                   for point in coordinates) + (" Z" if closed else ""))
+    return " ".join(d)
+
+
+def save_outline(filename, corners, seams=False):
+    """
+    write the outline of flattened triangles to an svg as a single path, and the edges
+    inside the pieces as another path on a layer of their own if seams is set
+    """
+    dwg = pattern_drawing(filename, corners)
+    points, outline, inside = pattern_edges(corners)
+    layers = [("outline", outline, rgb(0, 0, 0))]
+    if seams:
+        layers.append(("seams", inside, rgb(128, 128, 128)))
+    for name, edges, colour in layers:
+        layer = dwg.g(id=name)
+        # pieces without edges inside them leave an empty layer, as svg paths can't be empty
+        if len(edges):
+            layer.add(dwg.path(**{'d': chains_d(points, edge_chains(edges)),
+                                  'fill': "none", 'stroke-width': 4, 'stroke': colour}))
+        dwg.add(layer)
+    dwg.save()
+
+
+def save_pattern(filename, corners, outline=False, seams=False):
+    if outline:
+        save_outline(filename, corners, seams)
     else:
-        flatten_scene(lScene)
-        # Destroy all objects created by the FBX SDK.
-    lSdkManager.Destroy()
+        save_triangles(filename, corners)
+
+
+def flatten_job(job):
+    """
+    flatten one mesh and write it to its svg, returning its area, bounding box and how
+    long it took, and its flattened triangles if keep_corners is set. Errors are caught
+    so that the other meshes go on.
+    """
+    mesh, keep_corners, options = job
+    start = time()
+    result = {'name': mesh.name, 'filename': "{}.svg".format(mesh.name),
+              'triangles': len(mesh.triangles), 'error': None}
+    try:
+        corners = flatten_triangles(mesh.vertices, mesh.triangles)
+        save_pattern(result['filename'], corners, **options)
+        sides = corners[:, 1:] - corners[:, :1]
+        result['area'] = 0.5 * np.abs((sides[:, 1] * sides[:, 0].conjugate()).imag).sum()
+        result['bbox'] = (corners.real.min(), corners.real.max(), corners.imag.min(),
+                          corners.imag.max())
+        result['corners'] = corners if keep_corners else None
+    except Exception as e:
+        result['error'] = "{}: {}".format(type(e).__name__, e)
+    result['time'] = time() - start
+    return result
 
-    sys.exit(0)
+
+def flatten_meshes(meshes, jobs=1, layout=None, outline=False, seams=False):
+    """
+    flatten each mesh to its own svg, in jobs processes, printing a summary of each. If
+    layout is set, all of the meshes are also written to it side by side. outline and
+    seams are passed on to save_pattern.
+    """
+    start = time()
+    options = {'outline': outline, 'seams': seams}
+    work = [(mesh, layout is not None, options) for mesh in meshes]
+    if jobs > 1:
+        pool = Pool(jobs)
+        results = pool.imap(flatten_job, work)
+    else:
+        results = map(flatten_job, work)
+    placed = []
+    flattened = 0
+    for result in results:
+        if result['error'] is not None:
+            print("{}: {} triangles, {:.2f}s {}".format(
+                result['name'], result['triangles'], result['time'], result['error']))
+            continue
+        bbox = result['bbox']
+        print("{}: {} triangles, area {:.4g}, {:.4g} x {:.4g}, {:.2f}s -> {}".format(
+            result['name'], result['triangles'], result['area'], bbox[1] - bbox[0],
+            bbox[3] - bbox[2], result['time'], result['filename']))
+        flattened += 1
+        if result['corners'] is not None:
+            placed.append(result['corners'])
+    if jobs > 1:
+        pool.close()
+        pool.join()
+    print("flattened {} of {} meshes in {:.2f}s".format(flattened, len(meshes),
+                                                       time() - start))
+    if placed:
+        pieces = np.repeat(np.arange(len(placed)), [len(corners) for corners in placed])
+        save_pattern(layout, side_by_side(np.concatenate(placed), pieces), **options)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    flatten_meshes(load_meshes(args.filename if args.filename else args.fbx), args.jobs,
+                   args.layout, args.outline, args.seams)
@@ -1,14 +1,42 @@
 from svgpathtools import svg2paths, Path, Line
 from svgwrite import Drawing, rgb
 import argparse
-from math import atan, asin, sin, cos, pi
-from numpy import argmin
-from utils import calc_overall_bbox
+from math import atan, asin, sin, cos, pi, radians, sqrt
+from multiprocessing import Pool
+from os import listdir, makedirs
+from os.path import basename, dirname, isdir, join
+from time import time
+from numpy import absolute, append, arange, argmax, array, concatenate, exp, ones
+from seams import find_seams
+from utils import calc_overall_bbox, intersect_lines, segment_points, segment_ts
 
 parser = argparse.ArgumentParser(
     description='Generate a merged piece from two pieces by stretching the pattern piece along an edge')
 parser.add_argument('--filename', type=str,
                     help='The filename of the svg with at least two pattern pieces.')
+parser.add_argument('--batch', type=str,
+                    help="A folder of svgs, or a text file listing one svg per line, to "
+                         "merge the first two pieces of each of.")
+parser.add_argument('--output-folder', type=str,
+                    help="The folder to write the output to (defaults to the current "
+                         "directory, or merge_output for a batch, which gets a folder "
+                         "per svg).")
+parser.add_argument('--jobs', type=int, default=1,
+                    help="The number of processes to merge a batch with.")
+parser.add_argument('--debug-svg', action='store_true',
+                    help="Also write a drawing of how each piece was flexed, with the "
+                         "lines cast across it and the targets of the flexed sides.")
+parser.add_argument('--seam-tolerance', type=float,
+                    help="How far apart the ends of the segments of the two pieces can be "
+                         "for them to be on the side to merge (defaults to 1%% of the size "
+                         "of the pieces).")
+parser.add_argument('--num-lines', type=int, default=10,
+                    help="The number of lines to cast across the merged side to find the "
+                         "points of the other sides to line up with it.")
+parser.add_argument('--tolerance', type=float,
+                    help="Flatten the other sides into as few lines as keep within this "
+                         "distance of the curves (in document units), instead of steps of "
+                         "0.01 along each segment.")
 
 
 class Intersection(object):
@@ -24,31 +52,67 @@ class PathClip(object):
         self.target = target
 
 
-def flatten_shape(i, all_paths, merge_paths):
-    dwg = Drawing("merge_output%s.svg" % i, profile='tiny')
+class MergeDiagnostics(object):
+    """
+    what flatten_shape did to a piece: the lines cast across the merged side as (line,
+    start, first intersection with the other sides), the clips made at the
+    intersections, the (start index, clip index, start t, clip t) of the other sides
+    between clips, and the targets each flexed side was fitted to, with how much longer
+    (or shorter, if negative) than them the side was.
+    """
+    def __init__(self):
+        self.lines = []
+        self.clips = []
+        self.boundaries = []
+        self.targets = []
+        self.length_differences = []
 
-    def draw_line(start, end, offset=0.0):
-        start += offset
-        end += offset
-        dwg.add(dwg.line(start=(start.real, start.imag), end=(end.real, end.imag),
-                         stroke_width=4, stroke=rgb(255, 0, 0)))
 
-    dwg.add(dwg.path(**{'d': all_paths[i].d(), 'fill': "none", 'stroke-width': 4,
-                        'stroke': rgb(0, 0, 0)}))
-    dwg.add(dwg.path(**{'d': merge_paths[i].d(), 'fill': "none", 'stroke-width': 4,
-                        'stroke': rgb(255, 0, 0)}))
-    bbox = calc_overall_bbox(all_paths[i])
-    width, height = abs(bbox[1] - bbox[0]), abs(bbox[3] - bbox[2])
-    margin = 40
-    lower = min(bbox[2], bbox[3]) + height+margin
-    left = min(bbox[0], bbox[1]) + margin
+def transform_side(points, targets, angle_offset=0):
+    """
+    rotate and translate a side, given as a complex array of the points of a polyline,
+    such that its end points line up with the targets, trimming or extending its start
+    to match. Returns the points of the side and how much longer than the targets it was.
+    """
+    def angle(point1, point2):
+        diff = point1-point2
+        if diff.real == 0:
+            return 90.0
+        return atan(diff.imag / diff.real)*180.0/pi
+    # change this so that it has two targets
+    source_angle = angle(points[-1], points[0]) - angle(targets[0], targets[1])
+    points = points * exp(1j * radians(-source_angle + angle_offset))
+    source = points[-1] if angle_offset == 0 else points[0]
+    points = points + (targets[1] - source)
+    transformed_diff = abs(points[0] - points[-1])
+    targets_diff = abs(targets[0]-targets[1])
+    if transformed_diff < targets_diff:
+        points = concatenate([[targets[0]], points])
+    elif transformed_diff > targets_diff:
+        # the side starts on the first line whose end is close enough to the side's end,
+        # at the point on it that is exactly far enough
+        distances = absolute(points - points[-1])
+        first = argmax(distances[1:] <= targets_diff)
+        direction = points[first + 1] - points[first]
+        offset = points[first] - points[-1]
+        a = abs(direction) ** 2
+        b = 2 * (offset * direction.conjugate()).real
+        c = abs(offset) ** 2 - targets_diff ** 2
+        s = (-b - sqrt(max(b * b - 4 * a * c, 0))) / (2 * a)
+        points = points[first:].copy()
+        points[0] += s * direction
+    return points, transformed_diff - targets_diff
 
-    def draw_marker(loc, col=rgb(255, 0, 0), offset=(left, lower)):
-        dwg.add(dwg.circle(center=(loc.real + offset[0], loc.imag + offset[1]), r=4,
-                           fill=col))
 
+def flatten_shape(i, all_paths, merge_paths, other_paths, tolerance=None, num_lines=10):
+    """
+    flex the other sides of piece i such that its merged side becomes straight. Returns
+    the flexed sides, and the MergeDiagnostics of how they were made.
+    """
+    diagnostics = MergeDiagnostics()
+    bbox = calc_overall_bbox(all_paths[i])
+    width, height = abs(bbox[1] - bbox[0]), abs(bbox[3] - bbox[2])
     max_axis = max(width, height)
-    num_lines = 10
     points = [merge_paths[i].point(j / num_lines) for j in range(num_lines)] + [
         merge_paths[i].point(1.0)]
     angles = [
@@ -58,53 +122,30 @@ def flatten_shape(i, all_paths, merge_paths):
     ends = [max_axis * (sin(angle) + cos(angle) * 1j) for angle in
             angles]
     intersection_clips = []
-    for j, end in enumerate(ends):
-        end_point = end + points[j]
-        intersections = other_paths[i].intersect(Line(start=points[j], end=end_point))
-
-        for intersection in intersections[0]:
-            intersection_point = intersection[1].point(intersection[2])
-            target = merge_paths[i].length()*(1-j/num_lines) + abs(intersection_point - points[j])*1j
-            intersection_clips.append(PathClip(index=other_paths[i].index(intersection[1]),
-                                               t=intersection[2],
-                                               target=target))
-            if j % 10 == 0:
-                draw_line(points[j], intersection_point)
-                draw_marker(intersection_point, rgb(0, 255, 0), (0, 0))
-            break
+    # intersect all of the lines with the other sides at once
+    starts = array(points[:num_lines])
+    line_tolerance = max_axis / 1000.0 if tolerance is None else tolerance
+    lines, indices, ts = intersect_lines(other_paths[i], starts, starts + array(ends),
+                                         line_tolerance)
+    merge_length = merge_paths[i].length()
+    # only the first intersection along the other sides is used for each line
+    first = ones(len(lines), dtype=bool)
+    first[1:] = lines[1:] != lines[:-1]
+    for j, index, t in zip(lines[first].tolist(), indices[first].tolist(), ts[first].tolist()):
+        intersection_point = other_paths[i][index].point(t)
+        target = merge_length*(1-j/num_lines) + abs(intersection_point - points[j])*1j
+        intersection_clips.append(PathClip(index=index, t=t, target=target))
+        diagnostics.lines.append((j, points[j], intersection_point))
+    if len(intersection_clips) == 0:
+        # the lines are all cast to the same side of the merged side, so they miss the
+        # piece when it winds the wrong way
+        start, end = merge_paths[i].start, merge_paths[i].end
+        raise ValueError("none of the lines cast across the side of piece {} merged from "
+                         "({:g}, {:g}) to ({:g}, {:g}) hit its other sides".format(
+                             i, start.real, start.imag, end.real, end.imag))
 
     # make the flexed points by chopping the chunks of the other paths out, then
     # translating and rotating them such that their end points line up with the diff lines
-    def transform_side(sides, targets, angle_offset=0):
-        def angle(point1, point2):
-            diff = point1-point2
-            if diff.real == 0:
-                return 90.0
-            return atan(diff.imag / diff.real)*180.0/pi
-        # change this so that it has two targets
-        transformed_side = Path(*sides)
-        source_angle = angle(transformed_side.end, transformed_side.start) - \
-                       angle(targets[0], targets[1])
-        transformed_side = transformed_side.rotated(-source_angle+angle_offset)
-        source = transformed_side.end if angle_offset == 0 else transformed_side.start
-        diff = targets[1] - source
-        transformed_side = transformed_side.translated(diff)
-        draw_marker(targets[0], rgb(0, 200, 200))
-        draw_marker(targets[1], rgb(0, 255, 255))
-        transformed_diff = abs(transformed_side.start - transformed_side.end)
-        targets_diff = abs(targets[0]-targets[1])
-        if transformed_diff < targets_diff :
-            transformed_side.insert(0, Line(start=targets[0],
-                                            end=transformed_side.start))
-        elif transformed_diff > targets_diff:
-            # pop elements off until the transformed diff is smaller
-            while transformed_diff > targets_diff:
-                transformed_side.pop(0)
-                transformed_diff = abs(transformed_side.start - transformed_side.end)
-            print("path", transformed_side)
-            print("path is longer", transformed_diff-targets_diff)
-        return transformed_side
-
     start_index = 0
     curr_t = 0
     flexed_path = []
@@ -115,19 +156,22 @@ def flatten_shape(i, all_paths, merge_paths):
         intersection_clips.reverse()
     # add the end of the shape to the intersection clips
     intersection_clips.append(PathClip(index=len(other_paths[i])-1, t=1.0,
-                                       target=merge_paths[i].length()))
+                                       target=merge_length))
+    diagnostics.clips = intersection_clips
     last_target = 0
     for clip in intersection_clips:
         sides = []
-        print("boundaries", start_index, clip.index, curr_t, clip.t)
+        diagnostics.boundaries.append((start_index, clip.index, curr_t, clip.t))
         upper_t = clip.t if start_index == clip.index else 1.0
         while start_index <= clip.index and curr_t < upper_t:
             curr_seg = other_paths[i][start_index]
-            while curr_t < upper_t:
-                max_t = curr_t + t_resolution if curr_t+t_resolution < clip.t else clip.t
-                sides.append(Line(start=curr_seg.point(curr_t),
-                                  end=curr_seg.point(max_t)))
-                curr_t += t_resolution
+            if tolerance is not None:
+                ts = segment_ts(curr_seg, tolerance, curr_t, upper_t)
+            else:
+                ts = append(arange(curr_t, upper_t, t_resolution), upper_t)
+            side_points = segment_points(curr_seg, ts)
+            # the start of each segment is the end of the last
+            sides.append(side_points if len(sides) == 0 else side_points[1:])
             curr_t = upper_t
             if start_index != clip.index:
                 curr_t = 0.0
@@ -135,10 +179,47 @@ def flatten_shape(i, all_paths, merge_paths):
                 start_index += 1
                 upper_t = clip.t if start_index == clip.index else 1.0
         if len(sides) != 0:
-            flexed_path.append(transform_side(sides, [last_target, clip.target]))
+            targets = [last_target, clip.target]
+            side, length_difference = transform_side(concatenate(sides), targets)
+            side = side.tolist()
+            flexed_path.append(Path(*[Line(start=side[j], end=side[j + 1])
+                                      for j in range(len(side) - 1)]))
+            diagnostics.targets.append(targets)
+            diagnostics.length_differences.append(length_difference)
         last_target = clip.target
+    return flexed_path, diagnostics
 
-    straight_path = [Line(start=0, end=merge_paths[i].length())]
+
+def draw_diagnostics(filename, path, merge_path, flexed_path, diagnostics):
+    """
+    draw a piece with its merged side and the lines cast across it, and below it the
+    flexed sides with the targets they were fitted to
+    """
+    dwg = Drawing(filename, profile='tiny')
+    dwg.add(dwg.path(**{'d': path.d(), 'fill': "none", 'stroke-width': 4,
+                        'stroke': rgb(0, 0, 0)}))
+    dwg.add(dwg.path(**{'d': merge_path.d(), 'fill': "none", 'stroke-width': 4,
+                        'stroke': rgb(255, 0, 0)}))
+    bbox = calc_overall_bbox(path)
+    height = abs(bbox[3] - bbox[2])
+    margin = 40
+    lower = min(bbox[2], bbox[3]) + height+margin
+    left = min(bbox[0], bbox[1]) + margin
+
+    def draw_marker(loc, col=rgb(255, 0, 0), offset=(left, lower)):
+        dwg.add(dwg.circle(center=(loc.real + offset[0], loc.imag + offset[1]), r=4,
+                           fill=col))
+
+    for j, start, end in diagnostics.lines:
+        if j % 10 == 0:
+            dwg.add(dwg.line(start=(start.real, start.imag), end=(end.real, end.imag),
+                             stroke_width=4, stroke=rgb(255, 0, 0)))
+            draw_marker(end, rgb(0, 255, 0), (0, 0))
+    for targets in diagnostics.targets:
+        draw_marker(targets[0], rgb(0, 200, 200))
+        draw_marker(targets[1], rgb(0, 255, 255))
+
+    straight_path = [Line(start=0, end=merge_path.length())]
     for p in flexed_path:
         p = p.translated(left+lower*1j)
         dwg.add(dwg.path(d=p.d(), fill="none", stroke_width=4,
@@ -148,33 +229,43 @@ def flatten_shape(i, all_paths, merge_paths):
     transformed_path = Path(*transformed_path).translated(left + lower*1j)
     dwg.add(dwg.path(d=transformed_path.d(), fill="none", stroke_width=4,
                      stroke=rgb(0, 0, 0)))
-    bbox = calc_overall_bbox(list(all_paths[i]) + list(transformed_path))
+    bbox = calc_overall_bbox(list(path) + list(transformed_path))
 
     width, height = abs(bbox[1] - bbox[0]), abs(bbox[3] - bbox[2])
     dwg.viewbox(min(bbox[0], bbox[1]), min(bbox[2], bbox[3]), width, height)
     dwg.save()
-    return flexed_path
 
 
-if __name__ == "__main__":
-    args = parser.parse_args()
-    all_paths, attributes = svg2paths(args.filename)
-    # how do we figure out what sections of the path are linked?
-    diffs = [[abs(i.start - j.start) for j in all_paths[0]] for i in
-             all_paths[1]]
-    # get the location of the lowest value of the diffs - this will tell us the offset
-    diff_min = [argmin(diff) for diff in diffs]
-    offset_diffs = [diff_min[i + 1] - diff_min[i] for i in range(len(diff_min) - 1)]
-    # pull out the longest contiguous section of 1s
-    start_one = offset_diffs.index(1)
-    end_one = offset_diffs[::-1].index(1)
+def merge_file(filename, output_folder=".", seam_tolerance=None, tolerance=None,
+               num_lines=10, debug_svg=False):
+    """
+    merge the first two pieces of an svg along the side they share, writing the merged
+    and flexed sides to output_folder, along with a drawing of how each piece was flexed
+    if debug_svg is set. Returns the flexed sides of each piece.
+    """
+    all_paths, attributes = svg2paths(filename)
+    # the sections of the paths that are linked are the longest run of segments that
+    # line up end to end
+    seams = find_seams(all_paths[0], all_paths[1], seam_tolerance)
+    if len(seams) == 0:
+        raise ValueError("the first two pieces don't share a side")
     # for each of the shapes, construct a new shape where the section in the merge paths
     # is straight
-    merge_paths = [Path(*list(all_paths[i])[start_one:end_one]) for i in range(0, 2)]
-    other_paths = [Path(*list(all_paths[i])[end_one:]+list(all_paths[i])[0:start_one])
-                   for i in range(0, 2)]
-    flexed_paths = [flatten_shape(i, all_paths, merge_paths) for i in range(0, 2)]
-    dwg = Drawing("flexed_sides.svg", profile="tiny")
+    merge_paths = []
+    other_paths = []
+    for path, start in zip(all_paths[0:2], (seams[0].start0, seams[0].start1)):
+        segments = list(path)[start:] + list(path)[:start]
+        merge_paths.append(Path(*segments[:seams[0].length]))
+        other_paths.append(Path(*segments[seams[0].length:]))
+    flexed_paths = []
+    for i in range(0, 2):
+        flexed_path, diagnostics = flatten_shape(i, all_paths, merge_paths, other_paths,
+                                                 tolerance, num_lines)
+        if debug_svg:
+            draw_diagnostics("{}/merge_output{}.svg".format(output_folder, i), all_paths[i],
+                             merge_paths[i], flexed_path, diagnostics)
+        flexed_paths.append(flexed_path)
+    dwg = Drawing("{}/flexed_sides.svg".format(output_folder), profile="tiny")
     upper_sizes = [0, 0]
     for i, path_list in enumerate(flexed_paths):
         bbox = calc_overall_bbox(path_list)
@@ -192,7 +283,7 @@ if __name__ == "__main__":
                 abs(bbox[3] - bbox[2])+upper_sizes[1])
     dwg.save()
     # render the shapes selected
-    dwg = Drawing("merge_output.svg", profile='tiny')
+    dwg = Drawing("{}/merge_output.svg".format(output_folder), profile='tiny')
     for path in all_paths:
         dwg.add(dwg.path(
             **{'d': path.d(), 'fill': "none", 'stroke-width': 4, 'stroke': rgb(0, 0, 0)}))
@@ -204,3 +295,68 @@ if __name__ == "__main__":
     dwg.viewbox(min(bbox[0], bbox[1]), min(bbox[2], bbox[3]), abs(bbox[1] - bbox[0]),
                 abs(bbox[3] - bbox[2]))
     dwg.save()
+    return flexed_paths
+
+
+def batch_files(batch):
+    # the svgs in a folder, or listed one per line in a text file, relative to it
+    if isdir(batch):
+        return [join(batch, name) for name in sorted(listdir(batch)) if name.endswith(".svg")]
+    lines = [line.strip() for line in open(batch, "r").readlines()]
+    return [join(dirname(batch), line) for line in lines
+            if line and not line.startswith("#")]
+
+
+def merge_job(job):
+    # merge one svg of a batch, catching errors so that the rest of the batch goes on
+    filename, output_folder, options = job
+    start = time()
+    if not isdir(output_folder):
+        makedirs(output_folder)
+    try:
+        merge_file(filename, output_folder, **options)
+        error = None
+    except Exception as e:
+        error = "{}: {}".format(type(e).__name__, e)
+    return {'filename': filename, 'output_folder': output_folder, 'time': time() - start,
+            'error': error}
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    options = {'seam_tolerance': args.seam_tolerance, 'tolerance': args.tolerance,
+               'num_lines': args.num_lines, 'debug_svg': args.debug_svg}
+    if args.batch is None:
+        output_folder = args.output_folder or "."
+        if not isdir(output_folder):
+            makedirs(output_folder)
+        merge_file(args.filename, output_folder, **options)
+    else:
+        output_folder = args.output_folder or "merge_output"
+        # every svg gets a folder named after it, numbered if the name is taken
+        jobs = []
+        names = set()
+        for filename in batch_files(args.batch):
+            name = basename(filename).replace(".svg", "")
+            folder_name, count = name, 1
+            while folder_name in names:
+                folder_name, count = "{}_{}".format(name, count), count + 1
+            names.add(folder_name)
+            jobs.append((filename, join(output_folder, folder_name), options))
+        start = time()
+        if args.jobs > 1:
+            pool = Pool(args.jobs)
+            results = pool.imap(merge_job, jobs)
+        else:
+            results = map(merge_job, jobs)
+        failed = 0
+        for result in results:
+            status = "ok" if result['error'] is None else result['error']
+            failed += result['error'] is not None
+            print("{}: {:.2f}s {} -> {}".format(result['filename'], result['time'], status,
+                                               result['output_folder']))
+        if args.jobs > 1:
+            pool.close()
+            pool.join()
+        print("merged {} of {} in {:.2f}s".format(len(jobs) - failed, len(jobs),
+                                                 time() - start))
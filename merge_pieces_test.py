@@ -0,0 +1,28 @@
+# check that two squares that share a side merge when the second winds the other way, and
+# that when it winds the same way, so that the lines cast across its merged side miss it,
+# the batch reports which piece and side instead of an IndexError
+from os import chdir
+from tempfile import mkdtemp
+
+from merge_pieces import merge_job
+
+left = "M 0,0 L 100,0 L 100,100 L 0,100 Z"
+pieces = {
+    # both squares wind the same way, so they go along the shared side in opposite
+    # directions
+    'same': (left, "M 100,0 L 200,0 L 200,100 L 100,100 Z"),
+    'reversed': (left, "M 100,0 L 100,100 L 200,100 L 200,0 Z"),
+}
+
+chdir(mkdtemp(prefix="merge_pieces_test"))
+results = {}
+for name, (first, second) in pieces.items():
+    with open(name + ".svg", "w") as svg:
+        svg.write('<svg xmlns="http://www.w3.org/2000/svg"><path d="{}"/><path d="{}"/>'
+                  '</svg>'.format(first, second))
+    results[name] = merge_job((name + ".svg", name, {}))
+    print("{}: {}".format(name, results[name]['error'] or "ok"))
+
+assert results['reversed']['error'] is None, results['reversed']['error']
+assert results['same']['error'].startswith("ValueError") and \
+    "piece 1" in results['same']['error'], results['same']['error']
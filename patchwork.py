@@ -1,14 +1,30 @@
 import argparse
+import numpy as np
+from multiprocessing import Pool
+from os import makedirs
+from os.path import isdir
 from pdfrw import PdfReader
-from re import match
+import re
 from svgwrite import Drawing, rgb
 from svgwrite.container import Group
-from svgpathtools import Path, parse_path
+
+from utils import bezier_extrema, combine_bboxes, points_bboxes
 
 parser = argparse.ArgumentParser(
     description='Generate new pattern pieces from existing patterns')
 parser.add_argument('--filename', type=str, help='The filename of the pdf pattern.')
 parser.add_argument('--size', type=str, help="The size of the pattern to analyze.")
+parser.add_argument('--sizes', type=str,
+                    help="A comma-separated list of sizes to extract in one pass, or 'all' "
+                         "for every size in the pattern. Each size is written to its own "
+                         "folder.")
+parser.add_argument('--size-pattern', type=str, default=r"\d*X*[SML]|\d+(\.\d+)?",
+                    help="A regular expression matching the names of the layers that are "
+                         "sizes, for --sizes all (defaults to letter sizes like XS, M and "
+                         "3XL, and numeric sizes). Other layers, like cutting lines or "
+                         "text, are left out.")
+parser.add_argument('--jobs', type=int, default=1,
+                    help="The number of processes to parse pages with.")
 
 point_separator = ","
 
@@ -25,268 +41,409 @@ def cmyk(c, m, y, k):
     return r, g, b
 
 
-def transform_point(point, matrix=(1, 0, 0, 1, 0, 0), format="float", relative=False):
-    a, b, c, d, e, f = matrix
-    if isinstance(point, list):
-        x, y = point
-    else:
-        point_parts = point.split(',')
-        if len(point_parts) >= 2:
-            x, y = [float(x) for x in point_parts]
-        else:
-            # probably got a letter describing the point, i.e., m or z
-            return point
-    # if the transform is relative, don't apply the translation
-    if relative:
-        x, y = a * x + c * y, b * x + d * y
-    else:
-        x, y = a * x + c * y + e, b * x + d * y + f
-    if format == "float":
-        return x, y
-    else:
-        return "%s%s%s" % (x, point_separator, y)
+def format_number(value):
+    # integers are written without a trailing .0, like they appear in the pdf
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
 
 
-def format_pointstr(nums):
-    # format an even-length of nums into a1,b1 a2,b2 string list
-    return " ".join([point_separator.join(nums[i:i + 2]) for i in range(0, len(nums), 2)])
+# the path commands, in order of their code, and the number of points each consumes
+path_commands = "MLC"
+command_sizes = np.array([1, 1, 3])
 
 
-def transform_str(input, matrix):
-    # transform an input string by a matrix
-    parts = input.split(",")
-    if len(parts) == 1:
-        return input
-    else:
-        try:
-            point = [float(p) for p in parts]
-        except ValueError:
-            raise ValueError("invalid parts {}".format(parts))
-        return transform_point(point, matrix, format="str")
+class NumericPath(object):
+    """
+    a path stored as an array of command codes (indices into path_commands) and an
+    (n, 2) array of the points consumed by those commands, in order
+    """
+    def __init__(self, commands, points):
+        self.commands = np.asarray(commands, dtype=np.uint8)
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
 
+    def transformed(self, matrix):
+        # apply a pdf matrix (a, b, c, d, e, f) to all points at once
+        a, b, c, d, e, f = matrix
+        return NumericPath(self.commands, self.points.dot([[a, b], [c, d]]) + [e, f])
 
-def endswith(line, ending):
-    if len(line) == len(ending):
-        return line == ending
-    if line.find(ending) < 0:
-        return False
-    return len(line) - len(ending) == line.find(ending)
+    def d(self, closed=True):
+        # serialize to svg path data
+        coords = iter([format_number(x) + point_separator + format_number(y)
+                       for x, y in self.points])
+        parts = []
+        for command in self.commands:
+            parts.append(path_commands[command])
+            parts.extend([next(coords) for _ in range(command_sizes[command])])
+        if closed:
+            parts.append("Z")
+        return " ".join(parts)
 
+    def bbox(self):
+        # [xmin, xmax, ymin, ymax] of the path, including the extrema of the curves
+        points = self.points[:, 0] + 1j * self.points[:, 1]
+        ends = np.cumsum(command_sizes[self.commands])
+        extents = [points[ends - 1]]
+        curves = np.flatnonzero(self.commands == path_commands.index("C"))
+        curves = curves[curves > 0]
+        if len(curves) > 0:
+            control_points = np.stack([points[ends[curves - 1] - 1]] +
+                                      [points[ends[curves] - 3 + j] for j in range(3)],
+                                      axis=1)
+            extents.append(bezier_extrema(control_points).ravel())
+        return combine_bboxes(points_bboxes(np.concatenate(extents)[None, :]))
 
-def parse_shape(shape, i, gstates):
-    # see https://www.adobe.com/content/dam/acom/en/devnet/acrobat/pdfs/PDF32000_2008.pdf
-    output_filename = "page%s.svg" % i
-    dwg = Drawing(output_filename, profile='tiny')
-    fill = "none"
-    stroke = rgb(0, 0, 0)
-    stroke_width = 4
-    stroke_dasharray = None
-    stroke_miterlimit = None
-    transform = (1, 0, 0, 1, 0, 0)
-    shapes_stack = []
-    d = ""
-    paths = []
-    for line in shape.split("\n"):
-        line = line.strip()
-        parts = line.split(" ")
-        nums = []
-        for part in parts:
-            try:
-                nums.append(float(part))
-            except ValueError:
-                pass
-        if endswith(line, 'BDC'):
-            continue
-        elif endswith(line, 'Tj'):
-            text = ' '.join(parts[:-1])
-            text = text.split('Tj')[0]
-            group = Group(transform="matrix({})".format(' '.join([str(d) for d in transform])))
-            group.add(dwg.text(text))
-            shapes_stack.append(group)
-        elif endswith(line, 'Tc'):
-            pass # not yet implemented
-        elif endswith(line, 'Tm'):
-            for i, part in enumerate(parts):
-                if part == 'Tm':
-                    transform = [float(d) for d in parts[i-6: i]]
-                if part == 'Tw':
-                    word_spacing = parts[i-1]
-                if part == 'Tc':
-                    char_spacing = parts[i-1]
-        elif endswith(line, 'q'):
-            # q - start stack
-            continue
-        elif endswith(line, 're'):
-            # rectangle
-            vals = {'insert': (nums[0], nums[1]), 'size': (nums[2], nums[3])}
-            if fill:
-                vals['fill'] = fill
-            if stroke:
-                vals['stroke'] = stroke
-            shapes_stack.append(dwg.rect(**vals))
-        elif endswith(line, 'n'):
-            # - clipping path
-            continue
-        elif endswith(line, 'RG'):
-            # set stroke color
-            stroke = rgb(*nums[0:3])
-        elif endswith(line, 'K'):
-            stroke = rgb(*cmyk(*nums[0:4]))
-        elif endswith(line, 'J'):
-            # not sure how to implement cap styles
-            continue
-        elif endswith(line, 'cm'):
-            # current transformation matrix
-            transform = nums[0:6]
-        elif endswith(line, 'F') or endswith(line, 'f'):
-            # fill
-            fill = rgb(*nums[0:3])
-        elif endswith(line, 'm'):
-            # move to
-            d += " M " + format_pointstr(parts[0:2])
-        elif endswith(line, ' c'):
-            # curve
-            d += " C " + format_pointstr(parts[0:6])
-        elif endswith(line, 'v'):
-            # append to bezier curve
-            d += " S " + format_pointstr(parts[0:4])
-        elif endswith(line, 'y'):
-            d += " C " + format_pointstr(parts[0:4])+" "+format_pointstr(parts[2:4])
-        elif endswith(line, 'l'):
-            # line to
-            d += " L " + format_pointstr(parts[0:2])
-        elif endswith(line, 'h'):
-            # make sure it's a closed path
-            continue
-        elif endswith(line, 'S'):
-            # stroke to 4-unit width
+
+identity_matrix = (1, 0, 0, 1, 0, 0)
+
+# one alternative per token type of a content stream; whitespace and comments are
+# matched so that they can be skipped. Literal strings may nest parentheses one level.
+token_pattern = re.compile(r"""
+    (?P<space>\s+|%[^\r\n]*)
+    |(?P<number>[+-]?(?:\d+\.?\d*|\.\d+))
+    |(?P<name>/[^\s/\[\]()<>{}%]*)
+    |(?P<string>\((?:\\.|[^\\()]|\((?:\\.|[^\\()])*\))*\))
+    |(?P<dict_start><<)
+    |(?P<dict_end>>>)
+    |(?P<hexstring><[^>]*>)
+    |(?P<array_start>\[)
+    |(?P<array_end>\])
+    |(?P<operator>[^\s/\[\]()<>{}%]+)
+""", re.VERBOSE)
+
+
+def multiply_matrix(m1, m2):
+    # the product m1 x m2 of two pdf matrices in (a, b, c, d, e, f) form
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (a1 * a2 + b1 * c2, a1 * b2 + b1 * d2,
+            c1 * a2 + d1 * c2, c1 * b2 + d1 * d2,
+            e1 * a2 + f1 * c2 + e2, e1 * b2 + f1 * d2 + f2)
+
+
+def read_operations(stream):
+    """
+    tokenize a content stream in a single pass, yielding (operator, operands) pairs.
+    operands are kept as their source text; arrays and dictionaries become lists.
+    """
+    operands = []
+    containers = []
+    for token in token_pattern.finditer(stream):
+        kind = token.lastgroup
+        if kind == 'space':
             continue
-        elif endswith(line, 'Q'):
-            # end stack (draw)
-            # apply transformation...
-            for shape in shapes_stack:
-                dwg.add(shape)
-            if len(d) > 0:
-                paths.append(d + " Z")
-                d = " ".join([transform_str(p, transform) for p in d.split(" ")])
-                vals = {'d': d}
-                vals['stroke-width'] = stroke_width
-                if fill:
-                    vals['fill'] = fill
-                if stroke:
-                    vals['stroke'] = stroke
-                if stroke_dasharray:
-                    vals['stroke-dasharray'] = stroke_dasharray
-                if stroke_miterlimit:
-                    vals['stroke-miterlimit'] = stroke_miterlimit
-                dwg.add(dwg.path(**vals))
-            d = ''
-            shapes_stack = []
-        elif endswith(line, 'gs'):
-            key = parts[0]
-            if key not in gstates:
-                print("could not find state %s in dictionary")
-            state = gstates[key]
-            # color blending not yet implemented
-            pass
-        elif endswith(line, 'w'):
-            stroke_width = nums[0]
-        elif endswith(line, 'd'):
-            fullstring = " ".join(parts[:-1])
-            parsed = match('([\w\s\d]+)\[([\d\s]+)\](\d)', fullstring)
-            if parsed:
-                line_props = parsed.group(1)
-                if line_props.find('M') >= 0:
-                    m_part = line_props.split('M')[0].split(' ')[-2]
-                    stroke_miterlimit = float(m_part)
-                if line_props.find('w') >= 0:
-                    m_part = line_props.split('w')[0].split(' ')[-2]
-                    stroke_width = float(m_part)
-
-                stroke_dasharray = parsed.group(2)
-                offset = float(parsed.group(3)) # throw away the offset, it doesn't
-                # convert nicely to svg
-        elif endswith(line, 'M'):
-            stroke_miterlimit = nums[0]
+        value = token.group(kind)
+        if kind in ('array_start', 'dict_start'):
+            containers.append(operands)
+            operands = []
+        elif kind in ('array_end', 'dict_end'):
+            if not containers:
+                continue
+            container = operands
+            operands = containers.pop()
+            operands.append(container)
+        elif kind == 'operator' and not containers:
+            yield value, operands
+            operands = []
         else:
-            print("not sure what to do with %s" % line)
+            operands.append(value)
+
+
+class ShapeParser(object):
+    """
+    interpret the operators of a content stream, drawing them to dwg. Every stroked
+    shape is collected in paths as an untransformed NumericPath.
+    see https://www.adobe.com/content/dam/acom/en/devnet/acrobat/pdfs/PDF32000_2008.pdf
+    """
+    ignored_operators = {'BDC', 'BMC', 'EMC', 'BT', 'ET', 'Tc', 'Tw', 'n', 'W', 'W*',
+                         'J', 'j', 'S'}
+
+    def __init__(self, dwg, gstates):
+        self.dwg = dwg
+        self.gstates = gstates
+        self.state = {'fill': "none", 'stroke': rgb(0, 0, 0), 'stroke-width': 4,
+                      'stroke-dasharray': None, 'stroke-miterlimit': None,
+                      'transform': identity_matrix}
+        self.state_stack = []
+        self.text_matrix = identity_matrix
+        self.shapes_stack = []
+        self.commands = []
+        self.points = []
+        # the current point and the start of the current subpath, as [x, y]
+        self.current_point = None
+        self.subpath_start = None
+        self.paths = []
+        self.operators = {
+            'q': self.save_state, 'Q': self.restore_state, 'cm': self.concat_matrix,
+            'gs': self.set_gstate, 'w': self.set_line_width, 'M': self.set_miter_limit,
+            'd': self.set_dash, 'RG': self.set_stroke_rgb, 'K': self.set_stroke_cmyk,
+            'F': self.set_fill, 'f': self.set_fill, 'm': self.move_to, 'l': self.line_to,
+            'c': self.curve_to, 'v': self.curve_to_v, 'y': self.curve_to_y,
+            'h': self.close_path, 're': self.rectangle, 'Tm': self.set_text_matrix, 'Tj': self.show_text,
+        }
+
+    def parse(self, stream):
+        for operator, operands in read_operations(stream):
+            if operator in self.operators:
+                self.operators[operator](operands)
+            elif operator not in self.ignored_operators:
+                print("not sure what to do with %s" % operator)
+        return self.paths
+
+    def save_state(self, operands):
+        self.state_stack.append(dict(self.state))
+
+    def restore_state(self, operands):
+        # end stack (draw), applying the current transformation
+        for shape in self.shapes_stack:
+            self.dwg.add(shape)
+        if len(self.commands) > 0:
+            path = NumericPath(self.commands, self.points)
+            self.paths.append(path)
+            vals = {'d': path.transformed(self.state['transform']).d(closed=False),
+                    'stroke-width': self.state['stroke-width']}
+            for key in ('fill', 'stroke', 'stroke-dasharray', 'stroke-miterlimit'):
+                if self.state[key]:
+                    vals[key] = self.state[key]
+            self.dwg.add(self.dwg.path(**vals))
+        self.commands = []
+        self.points = []
+        self.shapes_stack = []
+        if self.state_stack:
+            self.state = self.state_stack.pop()
+
+    def concat_matrix(self, operands):
+        matrix = [float(p) for p in operands[0:6]]
+        self.state['transform'] = multiply_matrix(matrix, self.state['transform'])
+
+    def set_gstate(self, operands):
+        key = operands[0]
+        if key not in self.gstates:
+            print("could not find state %s in dictionary" % key)
+        # color blending not yet implemented
+
+    def set_line_width(self, operands):
+        self.state['stroke-width'] = float(operands[0])
+
+    def set_miter_limit(self, operands):
+        self.state['stroke-miterlimit'] = float(operands[0])
+
+    def set_dash(self, operands):
+        # throw away the phase, it doesn't convert nicely to svg
+        self.state['stroke-dasharray'] = " ".join(operands[0]) or None
+
+    def set_stroke_rgb(self, operands):
+        self.state['stroke'] = rgb(*[float(p) for p in operands[0:3]])
+
+    def set_stroke_cmyk(self, operands):
+        self.state['stroke'] = rgb(*cmyk(*[float(p) for p in operands[0:4]]))
+
+    def set_fill(self, operands):
+        self.state['fill'] = rgb(*[float(p) for p in operands[0:3]])
+
+    def add_segment(self, command, points):
+        # svg segments start where the last one ended, which isn't the current point
+        # after a rectangle or a closed subpath, so the path is moved there first
+        if command != "M" and self.current_point is not None and \
+                self.points[-2:] != self.current_point:
+            self.commands.append(path_commands.index("M"))
+            self.points.extend(self.current_point)
+        self.commands.append(path_commands.index(command))
+        self.points.extend(points)
+        self.current_point = list(points[-2:])
+        if command == "M":
+            self.subpath_start = self.current_point
+
+    def move_to(self, operands):
+        self.add_segment("M", [float(p) for p in operands[0:2]])
+
+    def line_to(self, operands):
+        self.add_segment("L", [float(p) for p in operands[0:2]])
+
+    def curve_to(self, operands):
+        self.add_segment("C", [float(p) for p in operands[0:6]])
+
+    def curve_to_v(self, operands):
+        # the first control point is the current point
+        nums = [float(p) for p in operands[0:4]]
+        if self.current_point is None:
+            # a path opened with v has no current point, so it starts at the second
+            # control point
+            self.move_to(operands[0:2])
+        self.add_segment("C", self.current_point + nums)
+
+    def curve_to_y(self, operands):
+        # the second control point is the end point
+        nums = [float(p) for p in operands[0:4]]
+        self.add_segment("C", nums + nums[2:4])
+
+    def close_path(self, operands):
+        self.current_point = self.subpath_start
+
+    def rectangle(self, operands):
+        nums = [float(p) for p in operands[0:4]]
+        # the rectangle is a closed subpath of its own, starting at its corner
+        self.current_point = self.subpath_start = nums[0:2]
+        vals = {'insert': (nums[0], nums[1]), 'size': (nums[2], nums[3])}
+        if self.state['fill']:
+            vals['fill'] = self.state['fill']
+        if self.state['stroke']:
+            vals['stroke'] = self.state['stroke']
+        self.shapes_stack.append(self.dwg.rect(**vals))
+
+    def set_text_matrix(self, operands):
+        self.text_matrix = [float(p) for p in operands[0:6]]
+
+    def show_text(self, operands):
+        transform = multiply_matrix(self.text_matrix, self.state['transform'])
+        group = Group(transform="matrix({})".format(' '.join([str(d) for d in transform])))
+        group.add(self.dwg.text(' '.join(operands)))
+        self.shapes_stack.append(group)
+
+
+def parse_shape(shape, i, gstates, output_folder="."):
+    output_filename = "{}/page{}.svg".format(output_folder, i)
+    dwg = Drawing(output_filename, profile='tiny')
+    paths = ShapeParser(dwg, gstates).parse(shape)
     dwg.save()
     return paths
 
 
-def calc_overall_bbox(paths):
-    overall_bbox = None
-    for path in paths:
-        if isinstance(path, str):
-            shape = parse_path(path)
-        else:
-            shape = path
-        bbox = shape.bbox()
-        xmin, xmax = min(bbox[0], bbox[1]), max(bbox[0], bbox[1])
-        ymin, ymax = min(bbox[2], bbox[3]), max(bbox[2], bbox[3])
-        if overall_bbox is None:
-            overall_bbox = [xmin,xmax, ymin, ymax]
-        else:
-            overall_bbox = [min(xmin, overall_bbox[0]), max(xmax, overall_bbox[1]),
-                            min(ymin, overall_bbox[2]), max(ymax, overall_bbox[3])]
-    return overall_bbox
+def index_optional_content(stream):
+    """
+    find every optional content section (/OC /key BDC ... EMC) of a content stream in a
+    single pass, returning a dictionary of property key to the list of section contents.
+    """
+    spans = {}
+    operands = []
+    open_sections = []
+    for token in token_pattern.finditer(stream):
+        kind = token.lastgroup
+        if kind == 'space':
+            continue
+        if kind != 'operator':
+            operands.append(token.group(kind))
+            continue
+        operator = token.group(kind)
+        if operator in ('BDC', 'BMC'):
+            key = None
+            if operator == 'BDC' and len(operands) > 1 and operands[0] == '/OC':
+                key = operands[1]
+            open_sections.append((key, token.end()))
+        elif operator == 'EMC' and open_sections:
+            key, start = open_sections.pop()
+            if key is not None:
+                spans.setdefault(key, []).append(stream[start:token.start()])
+        operands = []
+    return spans
 
 
-if __name__ == "__main__":
-    args = parser.parse_args()
-    x = PdfReader(args.filename, decompress=True)
-    name = '(' + args.size + ')'
-    shapes = []
-    paths = []
-    for page_num, page in enumerate(x.pages):
+def extract_sizes(pdf, sizes=None, size_pattern=None):
+    """
+    index the optional content of every page once, returning a dictionary of size name
+    to a list of (page number, shape, gstates). If sizes is None, every layer whose name
+    matches size_pattern (a regular expression, ignoring case) is extracted.
+    """
+    if size_pattern is not None:
+        size_pattern = re.compile("(?:{})$".format(size_pattern), re.IGNORECASE)
+    shapes = {}
+    for page_num, page in enumerate(pdf.pages):
         if '/Resources' not in page:
             continue
         if '/Properties' not in page['/Resources']:
             continue
-        oc_keyname = [key for key in page['/Resources']['/Properties']
-                      if page['/Resources']['/Properties'][key]['/Name'] == name]
-        if len(oc_keyname) == 0:
+        properties = page['/Resources']['/Properties']
+        # map the keys used in the content stream to the size names
+        size_keys = {}
+        for key in properties:
+            if '/Name' not in properties[key]:
+                continue
+            size = properties[key]['/Name'].to_unicode()
+            if sizes is None:
+                is_size = size_pattern is None or size_pattern.match(size.strip())
+            else:
+                is_size = size in sizes
+            if is_size:
+                size_keys[key] = size
+        if len(size_keys) == 0:
             continue
-        gstates = {}
+        # only the names of the graphics states are used, and unlike the PdfDict they
+        # can be sent to the page jobs
+        gstates = set()
         if '/ExtGState' in page['/Resources']:
-            gstates = page['/Resources']['/ExtGState']
-        oc_keyname = oc_keyname[0]
-        lines = page.Contents.stream.split('\n')
-        start_index = [i for i, l in enumerate(lines) if l.find(oc_keyname) >= 0][0]
-        end_index = \
-        [i for i, l in enumerate(lines) if l.find('EMC') >= 0 and i > start_index][0]
-        shape = "\n".join(lines[start_index:end_index])
-        paths += parse_shape(shape, page_num, gstates)
-    # all paths
-    paths = sorted(list(set(paths)))
+            gstates = set(str(key) for key in page['/Resources']['/ExtGState'].keys())
+        spans = index_optional_content(page.Contents.stream)
+        for key, size in size_keys.items():
+            if key not in spans:
+                continue
+            shapes.setdefault(size, []).append((page_num, "\n".join(spans[key]), gstates))
+    return shapes
+
+
+def write_paths(paths, output_folder="."):
+    # all paths, serialized once and de-duplicated by their path data
+    paths = {path.d(): path for path in paths}
+    ds = sorted(paths)
     vals = {'fill': 'none', 'stroke': rgb(0, 0, 0), 'stroke-width': 4}
-    output_filename = "all_paths.svg"
+    output_filename = "{}/all_paths.svg".format(output_folder)
     dwg = Drawing(output_filename, profile='tiny')
-    overall_bbox = calc_overall_bbox(paths)
+    bboxes = [paths[d].bbox() for d in ds]
+    xmins, xmaxs, ymins, ymaxs = zip(*bboxes)
+    overall_bbox = [min(xmins), max(xmaxs), min(ymins), max(ymaxs)]
     print(overall_bbox)
-    for path in paths:
-        vals['d'] = path
+    for d in ds:
+        vals['d'] = d
         dwg.add(dwg.path(**vals))
     dwg.viewbox(overall_bbox[0], overall_bbox[2], abs(overall_bbox[1] - overall_bbox[0]),
                 abs(overall_bbox[3] - overall_bbox[2]))
     dwg.save()
 
     # make svgs of all paths
-    for i, ds in enumerate(paths):
-        output_filename = "path%s.svg" % i
+    for i, (d, bbox) in enumerate(zip(ds, bboxes)):
+        output_filename = "{}/path{}.svg".format(output_folder, i)
         dwg = Drawing(output_filename, profile='tiny')
-        if isinstance(ds, list):
-            for d in ds:
-                vals['d'] = d,
-                dwg.add(dwg.path(**vals))
-        else:
-            vals['d'] = ds
-            shape = parse_path(ds)
-            bbox = calc_overall_bbox(shape._segments)
-            width = abs(bbox[1] - bbox[0])
-            height = abs(bbox[3] - bbox[2])
-            if width == 0.0 or height == 0.0:
-                continue
-            dwg.viewbox(min(bbox[0], bbox[1]), min(bbox[2], bbox[3]), width, height)
-            dwg.add(dwg.path(**vals))
+        vals['d'] = d
+        width = abs(bbox[1] - bbox[0])
+        height = abs(bbox[3] - bbox[2])
+        if width == 0.0 or height == 0.0:
+            continue
+        dwg.viewbox(min(bbox[0], bbox[1]), min(bbox[2], bbox[3]), width, height)
+        dwg.add(dwg.path(**vals))
         dwg.save()
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    x = PdfReader(args.filename, decompress=True)
+    if args.sizes is None:
+        sizes = [args.size]
+    elif args.sizes == 'all':
+        sizes = None
+    else:
+        sizes = args.sizes.split(",")
+    shapes = extract_sizes(x, sizes, args.size_pattern)
+    # a single size is written to the current directory, several get a folder each
+    output_folders = {size: "." if args.sizes is None else "size_{}".format(size)
+                      for size in shapes}
+    for output_folder in output_folders.values():
+        if not isdir(output_folder):
+            makedirs(output_folder)
+    # pages are independent, so they can be parsed in any process. The results are
+    # collected in page order so the output matches a serial run.
+    page_jobs = [(shape, page_num, gstates, output_folders[size])
+                 for size in shapes for page_num, shape, gstates in shapes[size]]
+    if args.jobs > 1:
+        pool = Pool(args.jobs)
+        page_paths = pool.starmap(parse_shape, page_jobs)
+        pool.close()
+        pool.join()
+    else:
+        page_paths = [parse_shape(*page_job) for page_job in page_jobs]
+    page_paths = iter(page_paths)
+    for size in shapes:
+        paths = []
+        for _ in shapes[size]:
+            paths += next(page_paths)
+        if len(paths) == 0:
+            print("no paths found for size %s" % size)
+            continue
+        write_paths(paths, output_folders[size])
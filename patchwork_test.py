@@ -0,0 +1,70 @@
+# check that parsing the pages of a pattern in parallel gives the same svgs as parsing
+# them one at a time, for pages with graphics states, that --sizes all only extracts the
+# layers that are sizes, and that v curves are parsed from the current point
+from filecmp import cmp
+from os import listdir, makedirs
+from os.path import abspath, dirname, join
+import subprocess
+import sys
+from tempfile import mkdtemp
+
+from pdfrw import PdfDict, PdfName, PdfWriter
+from svgwrite import Drawing
+
+from patchwork import ShapeParser
+
+folder = mkdtemp(prefix="patchwork_test")
+pdf_filename = join(folder, "pattern.pdf")
+script = join(dirname(abspath(__file__)), "patchwork.py")
+
+
+def page(offset):
+    # a page with one piece in the M size layer, drawn with a graphics state, and a line
+    # in a layer that isn't a size. The state is an indirect object, as it is in most
+    # pattern pdfs
+    content = "/OC /MC0 BDC q /GS0 gs 2 w 0 0 0 RG {0} {0} m {1} {0} l {1} {1} l " \
+              "{0} {1} l h S Q EMC /OC /MC1 BDC q 0 0 m {1} 0 l S Q EMC".format(
+                  10 + offset, 100 + offset)
+    properties = PdfDict(MC0=PdfDict(Type=PdfName.OCG, Name="M"),
+                         MC1=PdfDict(Type=PdfName.OCG, Name="Cutting lines"))
+    gstates = PdfDict(GS0=PdfDict(Type=PdfName.ExtGState, CA=1), indirect=True)
+    return PdfDict(Type=PdfName.Page, MediaBox=[0, 0, 612, 792],
+                   Resources=PdfDict(Properties=properties, ExtGState=gstates),
+                   Contents=PdfDict(stream=content))
+
+
+writer = PdfWriter()
+for page_num in range(3):
+    writer.addpage(page(page_num * 20))
+writer.write(pdf_filename)
+
+for run, jobs in (("serial", "1"), ("parallel", "2")):
+    output_folder = join(folder, run)
+    makedirs(output_folder)
+    subprocess.check_call([sys.executable, script, "--filename", abspath(pdf_filename),
+                           "--size", "M", "--jobs", jobs], cwd=output_folder, timeout=60)
+
+outputs = sorted(listdir(join(folder, "serial")))
+assert outputs == sorted(listdir(join(folder, "parallel"))), outputs
+for output in outputs:
+    assert cmp(join(folder, "serial", output), join(folder, "parallel", output),
+               shallow=False), output
+print("{} outputs match".format(len(outputs)))
+
+all_folder = join(folder, "all")
+makedirs(all_folder)
+subprocess.check_call([sys.executable, script, "--filename", abspath(pdf_filename),
+                       "--sizes", "all"], cwd=all_folder, timeout=60)
+assert listdir(all_folder) == ["size_M"], listdir(all_folder)
+
+# v curves start at the current point, also after a rectangle or a closed subpath
+for stream, expected in (
+        ("0 0 m 10 0 l 20 20 30 30 v", "M 0,0 L 10,0 C 10,0 20,20 30,30"),
+        ("0 0 m 10 0 l 50 50 5 5 re 20 20 30 30 v",
+         "M 0,0 L 10,0 M 50,50 C 50,50 20,20 30,30"),
+        ("0 0 m 10 0 l 10 10 l h 20 20 30 30 v",
+         "M 0,0 L 10,0 L 10,10 M 0,0 C 0,0 20,20 30,30")):
+    parser = ShapeParser(Drawing(join(folder, "shapes.svg")), set())
+    paths = parser.parse("q {} S Q".format(stream))
+    assert paths[0].d(closed=False) == expected, (stream, paths[0].d(closed=False))
+print("v curves start at the current point")
@@ -1,15 +1,23 @@
-from math import pi, exp, cos, sin, radians
-from os.path import basename, isdir
+from math import ceil, pi, exp, cos, sin, radians
+from os.path import basename, isdir, isfile
 
+from collections import namedtuple
+from copy import copy
+from multiprocessing import Pool
 from os import makedirs
 import subprocess
+from time import time
+import numpy as np
 from svgpathtools import Line, svg2paths, Path, parse_path
 from svgwrite import Drawing, rgb
 
-from svgpathtools.svg2paths import combine_transforms, transform_path
-from utils import calc_overall_bbox, get_paletton
+from svgpathtools.svg2paths import transform_path
+from cache import RenderCache, file_digest
+from rasterizer import paint_properties, painted, parse_length, parse_paint, render_png
+from utils import calc_overall_bbox, clip_area, clip_stroke, get_paletton, split_segments
 import argparse
 import xml.dom.minidom
+from xml.etree import ElementTree
 
 parser = argparse.ArgumentParser(
     description='Generate a fabric pattern by doing a cairo tiling of another SVG')
@@ -21,10 +29,46 @@ parser.add_argument('--dx', type=float,
 parser.add_argument('--dy', type=float,
                     help="The y-distance to translate the image (in percentage of the "
                          "total height).")
-parser.add_argument('--scale', type=float,
+parser.add_argument('--scale', type=float, default=1,
                     help="The scaling factor for the input image (in a fractional value).")
 parser.add_argument('--repetitions', type=float,
                     help="The number of repetitions along each dimension of the tiling.")
+parser.add_argument('--fabric-width', type=float,
+                    help="The width of the fabric to fill with the tiling, in inches. "
+                         "Overrides --repetitions.")
+parser.add_argument('--fabric-length', type=float,
+                    help="The length of the fabric to fill with the tiling, in inches "
+                         "(defaults to the width).")
+parser.add_argument('--dpi', type=float, default=150,
+                    help="The number of svg units and png pixels per inch of fabric.")
+parser.add_argument('--symbols', action='store_true',
+                    help="Define the tile once and place it with <use> elements, instead "
+                         "of copying its paths into every placement.")
+parser.add_argument('--clip', action='store_true',
+                    help="Clip the image to the pentagon it is placed in, leaving out the "
+                         "parts that fall outside of it.")
+parser.add_argument('--stream', action='store_true',
+                    help="Write the rows of the tiling to the svg as they are generated, "
+                         "instead of building the whole document in memory first.")
+parser.add_argument('--rasterizer', type=str, default="scanline",
+                    choices=["scanline", "imagemagick"],
+                    help="How to render the png: in process with the scanline rasterizer, "
+                         "or by converting the svg with imagemagick.")
+parser.add_argument('--cache', type=str,
+                    help="A folder to cache the imported tile and rendered outputs in, so "
+                         "that repeated renders are copied from it.")
+parser.add_argument('--cache-size', type=float, default=512,
+                    help="The size in MB above which the least recently used entries of "
+                         "the cache are removed.")
+parser.add_argument('--sweep-dx', type=float, nargs='+',
+                    help="Render a variant for each of these x-distances.")
+parser.add_argument('--sweep-dy', type=float, nargs='+',
+                    help="Render a variant for each of these y-distances.")
+parser.add_argument('--sweep-scale', type=float, nargs='+',
+                    help="Render a variant for each of these scaling factors.")
+parser.add_argument('--jobs', type=int,
+                    help="The number of processes to render sweep variants with (defaults "
+                         "to the number of cpus).")
 
 
 def cexp(x):
@@ -43,11 +87,26 @@ def rotate_transform(angle):
     return c(angle), s(angle), -s(angle), c(angle), 0, 0
 
 
-def format_transform(angle, diff):
-    transform1 = rotate_transform(angle)
-    transform2 = 1, 0, 0, 1, diff.real, diff.imag
-    transform = combine_transforms(transform2, transform1)
-    return "matrix({},{},{},{},{},{})".format(*transform)
+def affine_matrix(a, b, c, d, e, f):
+    # the 3x3 matrix of the svg transform matrix(a, b, c, d, e, f)
+    return np.array([[a, c, e], [b, d, f], [0, 0, 1]], dtype=float)
+
+
+def format_matrix(matrix):
+    # the svg transform of a 2x3 affine matrix
+    (a, c, e), (b, d, f) = matrix[:2].tolist()
+    return "matrix({},{},{},{},{},{})".format(a, b, c, d, e, f)
+
+
+def add_style(attributes, declaration):
+    # a copy of an svg element's attributes with a declaration added to its style
+    style = attributes.get('style')
+    return dict(attributes, style=declaration if not style else style + ";" + declaration)
+
+
+# every placement of a pentagon in a tiling, as arrays with one entry per placement
+Lattice = namedtuple("Lattice", ["matrices", "offsets", "rows", "columns", "pentagons",
+                                 "colors"])
 
 
 def prop(property_name, generator):
@@ -58,13 +117,43 @@ def prop(property_name, generator):
     return property(getter)
 
 
+# the tilers of a sweep, by scale, shared with each worker process once
+sweep_tilers = {}
+
+
+def init_sweep_worker(tilers):
+    global sweep_tilers
+    sweep_tilers = tilers
+
+
+def render_variant(variant):
+    dx, dy, scale, export = variant
+    start = time()
+    tiler = sweep_tilers[scale]
+    output_filename = tiler.draw_pattern(dx, dy)
+    if export:
+        tiler.export_png(output_filename, dx, dy)
+    return {'dx': dx, 'dy': dy, 'scale': scale, 'filename': output_filename,
+            'time': time() - start}
+
+
 class CairoTiler(object):
-    def __init__(self, filename, dx=None, dy=None, repetitions=3, scale=1):
+    def __init__(self, filename, dx=None, dy=None, repetitions=3, scale=1, symbols=False,
+                 rasterizer="scanline", stream=False, clip=False, fabric_width=None,
+                 fabric_length=None, dpi=150, cache=None, cache_size=512):
         self.filename = filename
         self.dx = dx
         self.dy = dy
         self.scale = scale
-        if repetitions is None:
+        self.symbols = symbols
+        self.rasterizer = rasterizer
+        self.stream = stream
+        self.clip = clip
+        self.fabric_width = fabric_width
+        self.fabric_length = fabric_width if fabric_length is None else fabric_length
+        self.dpi = dpi
+        self.cache = None if cache is None else RenderCache(cache, int(cache_size * 2 ** 20))
+        if repetitions is None and fabric_width is None:
             raise ValueError("got no repetitions")
         self.repetitions = repetitions
 
@@ -74,6 +163,7 @@ class CairoTiler(object):
 
     bottom_length = prop("bottom_length", "calc_bottom_length")
     cairo_group = prop("cairo_group", "calculate_transforms")
+    cell_size = prop("cell_size", "calc_pattern_viewbox")
     colors = prop("colors", "init_colors")
     column_offset = prop("column_offset", "calculate_transforms")
     pattern_viewbox = prop("pattern_viewbox", "calc_pattern_viewbox")
@@ -83,16 +173,24 @@ class CairoTiler(object):
     pent_y = prop("pent_y", "calc_pentagon_dimensions")
     points = prop("points", "init_pentagon_points")
     rep_spacing = prop("rep_spacing", "calc_rep_spacing")
+    source_digest = prop("source_digest", "calc_source_digest")
     tile_attributes = prop("tile_attributes", "import_tile")
+    tile_bbox = prop("tile_bbox", "calc_tile_bbox")
+    tile_path_data = prop("tile_path_data", "serialize_tile")
     tile_paths = prop("tile_paths", "import_tile")
+    tile_viewbox = prop("tile_viewbox", "calc_tile_viewbox")
     transforms = prop("transforms", "calculate_transforms")
 
     @property
     def num_down(self):
+        if self.fabric_width is not None:
+            return int(1 + ceil(self.pattern_viewbox[3] / self.cell_size[1]))
         return int(1 + self.repetitions)
 
     @property
     def num_across(self):
+        if self.fabric_width is not None:
+            return int(1 + 2 * ceil(self.pattern_viewbox[2] / self.cell_size[0]))
         return int(1 + 2 * self.repetitions)
 
     def calc_rep_spacing(self):
@@ -105,9 +203,14 @@ class CairoTiler(object):
         bbox = calc_overall_bbox(self.cairo_group)
         vbwidth = self.cairo_group[1][3].end.real + self.pent_height
         vbheight = self.pent_height * 2
+        self._cell_size = vbwidth, vbheight
+        if self.fabric_width is not None:
+            # the viewbox is the fabric, at dpi units per inch
+            vbwidth, vbheight = self.fabric_width * self.dpi, self.fabric_length * self.dpi
+        else:
+            vbwidth, vbheight = vbwidth * self.repetitions, vbheight * self.repetitions
         self._pattern_viewbox = min(bbox[0], bbox[1]) + self.cairo_group[1][2].end.real, \
-                                min(bbox[2], bbox[3]), vbwidth * self.repetitions, \
-                                vbheight * self.repetitions
+                                min(bbox[2], bbox[3]), vbwidth, vbheight
 
     def calc_pentagon_dimensions(self):
         bbox = calc_overall_bbox(self.new_pentagon())
@@ -115,6 +218,32 @@ class CairoTiler(object):
             bbox[3] - bbox[2])
         self._pent_x, self._pent_y = min(bbox[0], bbox[1]), min(bbox[2], bbox[3])
 
+    def calc_source_digest(self):
+        self._source_digest = file_digest(self.filename)
+
+    def render_key(self, dx, dy, *extra):
+        # the cache key of an output, from everything other than the palette it depends on
+        return (self.source_digest, dx, dy, self.scale, self.repetitions, self.symbols,
+                self.clip, self.fabric_width, self.fabric_length, self.dpi) + extra
+
+    def calc_tile_bbox(self):
+        self._tile_bbox = calc_overall_bbox(self.tile_paths)
+
+    def calc_tile_viewbox(self):
+        # the (x, y, width, height) viewbox of the tile's svg, scaled as its paths are. An
+        # svg without one is sized by its width and height, or failing that its paths
+        root = xml.dom.minidom.parse(self.filename).documentElement
+        if root.getAttribute("viewBox"):
+            viewbox = [float(value) for value in root.getAttribute("viewBox").replace(
+                ",", " ").split()]
+        elif root.getAttribute("width") and root.getAttribute("height"):
+            viewbox = [0, 0, parse_length(root.getAttribute("width")),
+                       parse_length(root.getAttribute("height"))]
+        else:
+            xmin, xmax, ymin, ymax = calc_overall_bbox(svg2paths(self.filename)[0])
+            viewbox = [xmin, ymin, xmax - xmin, ymax - ymin]
+        self._tile_viewbox = tuple(value * self.scale for value in viewbox)
+
     def calculate_transforms(self):
         self._transforms = [[0, 0]]
         self._cairo_group = [self.new_pentagon()]
@@ -135,6 +264,69 @@ class CairoTiler(object):
         self._cairo_group[3] = self._cairo_group[3].translated(diff)
         self._column_offset = self._cairo_group[0][0].end - self._cairo_group[1][2].end
 
+    def lattice(self, num_down=None, num_across=None, region=None, bbox=None):
+        """
+        every placement of a pentagon in a num_down x num_across tiling, in drawing order.
+        If region, an (x, y, width, height), is given, only the placements that draw inside
+        it are made: bbox is the [xmin, xmax, ymin, ymax] of what each placement draws
+        before it is placed (the tile's bbox by default), and the rows and columns of the
+        cells that reach the region are found from the spacing of the lattice.
+        matrices are the 2x3 affine matrices that place the pentagon in the pattern,
+        offsets the offset of the cell the placement is in, rows and columns the cell,
+        pentagons the index of the pentagon in transforms and colors the index of its
+        color, before wrapping around the palette.
+        """
+        num_down = self.num_down if num_down is None else num_down
+        num_across = self.num_across if num_across is None else num_across
+        diffs = np.array([diff for angle, diff in self.transforms], dtype=complex)
+        rotations = np.array([affine_matrix(*rotate_transform(angle))[:2, :2]
+                              for angle, diff in self.transforms])
+        rows, columns = np.arange(num_down), np.arange(num_across)
+        # which pentagons of each cell are placed, by row, column and pentagon
+        placed = np.ones((num_down, num_across, 4), dtype=bool)
+        if region is not None:
+            x, y, width, height = region
+            xmin, xmax, ymin, ymax = self.tile_bbox if bbox is None else bbox
+            corners = np.array([[xmin, xmax, xmin, xmax], [ymin, ymin, ymax, ymax]])
+            # what each pentagon draws, relative to the offset of its cell
+            drawn = np.matmul(rotations, corners) + np.stack([diffs.real, diffs.imag],
+                                                             axis=1)[:, :, None]
+            # the offsets of the cells of even and odd columns from (column // 2, row) *
+            # rep_spacing, by which what each pentagon draws is shifted
+            shifts = np.array([[0, 0], [self.pent_width * 2 + self.column_offset.real,
+                                        self.column_offset.imag]])[:, None]
+            lower, upper = drawn.min(axis=2) + shifts, drawn.max(axis=2) + shifts
+            # the range of column // 2 and of the rows that reach the region, by the
+            # parity of the column and the pentagon
+            spacing = self.rep_spacing
+            halves = np.ceil((x - upper[:, :, 0]) / spacing), \
+                np.floor((x + width - lower[:, :, 0]) / spacing)
+            spans = np.ceil((y - upper[:, :, 1]) / spacing), \
+                np.floor((y + height - lower[:, :, 1]) / spacing)
+            rows = rows[max(int(spans[0].min()), 0):max(int(spans[1].max()) + 1, 0)]
+            columns = columns[max(int(2 * halves[0].min()), 0):
+                              max(int(2 * halves[1].max()) + 2, 0)]
+            parity, half = columns % 2, columns // 2
+            placed = (half[:, None] >= halves[0][parity]) & (half[:, None] <= halves[1][parity])
+            placed = placed[None] & (rows[:, None, None] >= spans[0][parity]) & \
+                (rows[:, None, None] <= spans[1][parity])
+        row_index, column_index, pentagons = np.nonzero(placed)
+        rows, columns = rows[row_index], columns[column_index]
+        # the offset of each placement's cell
+        # if x is odd, point 1 of pent 1 needs to be attached to point 3 of pent 2
+        odd = columns % 2 == 1
+        spacing = columns // 2 * self.rep_spacing
+        cells = np.where(odd, spacing + self.pent_width * 2 + self.column_offset.real,
+                         spacing) + 1j * np.where(odd, self.column_offset.imag, 0)
+        cells = cells + 1j * self.rep_spacing * rows
+        translations = cells + diffs[pentagons]
+        matrices = np.empty((len(pentagons), 2, 3))
+        matrices[:, :, :2] = rotations[pentagons]
+        matrices[:, 0, 2] = translations.real
+        matrices[:, 1, 2] = translations.imag
+        return Lattice(matrices, cells, rows, columns, pentagons,
+                       (rows * num_across + columns) * 4 + pentagons)
+
     def init_pentagon_points(self):
         # we want a pentagon with the interior angles 120, 90, 120, 120, 90 interior
         # angles
@@ -171,7 +363,7 @@ class CairoTiler(object):
         path_filename = "{}/path_clip_{}.svg".format(self.output_folder,
             basename(self.filename).replace(".svg", ""))
         dwg = Drawing(path_filename)
-        image_bbox = calc_overall_bbox(self.tile_paths)
+        image_bbox = self.tile_bbox
 
         dx = self.pent_x - min(image_bbox[0], image_bbox[1])
         dy = self.pent_y - min(image_bbox[2], image_bbox[3])
@@ -184,10 +376,8 @@ class CairoTiler(object):
         clip_path.add(dwg.path(d=self.new_pentagon().d()))
         group = dwg.add(dwg.g(clip_path="url(#pent_path)", transform=transform,
                               id="clippedpath"))
-        for i, path in enumerate(self.tile_paths):
-            group.add(
-                dwg.path(d=path.d(), style=self.tile_attributes[i].get('style'),
-                         id=self.tile_attributes[i]['id']))
+        for path_data in self.tile_path_data:
+            group.add(dwg.path(**path_data))
         dwg.add(dwg.use("#clippedpath", transform="transform(100, 100)"))
 
         dwg.viewbox(self.pent_x, self.pent_y, self.pent_width, self.pent_height)
@@ -196,42 +386,110 @@ class CairoTiler(object):
         open(path_filename, "w").write(xml.toprettyxml())
 
     def import_tile(self):
-        self._tile_paths, self._tile_attributes = svg2paths(self.filename)
-        if self.scale == 1:
+        key = ("tile", self.source_digest, self.scale)
+        cached = None if self.cache is None else self.cache.get_object(key)
+        if cached is not None:
+            self._tile_paths, self._tile_attributes = cached
             return
-        for i, path in enumerate(self._tile_paths):
-            self._tile_paths[i] = path.scaled(self.scale)
+        self._tile_paths, self._tile_attributes = svg2paths(self.filename)
+        if self.scale != 1:
+            for i, path in enumerate(self._tile_paths):
+                self._tile_paths[i] = path.scaled(self.scale)
+        if self.cache is not None:
+            self.cache.put_object(key, (self._tile_paths, self._tile_attributes))
+
+    def serialize_tile(self):
+        # the attributes of each tile path, serialized once and shared by all placements
+        self._tile_path_data = [{'d': path.d(), 'style': self.tile_attributes[i].get('style'),
+                                 'id': self.tile_attributes[i]['id']}
+                                for i, path in enumerate(self.tile_paths)]
+
+    def clipped_tile(self, dx, dy):
+        """
+        the tile, translated by dx and dy, clipped to the pentagon, as a list of (path,
+        attributes) and the matching list of path data. Paths inside the pentagon are
+        kept as they are and paths outside it are left out. Paths that cross it are cut
+        where they cross, with their fill clipped as an area and their stroke as lines, so
+        a path with both becomes two.
+        Every pentagon is drawn in the same coordinates, so the result is shared by all
+        four orientations; it is cached for each offset.
+        """
+        if not hasattr(self, "_clipped_tiles"):
+            self._clipped_tiles = {}
+        if (dx, dy) in self._clipped_tiles:
+            return self._clipped_tiles[(dx, dy)]
+        snake_width, snake_height = abs(self.tile_bbox[0] - self.tile_bbox[1]), \
+                                    abs(self.tile_bbox[2] - self.tile_bbox[3])
+        offset = snake_width * dx + snake_height * dy * 1j
+        pentagon = np.array(self.points, dtype=complex)
+        # how closely the crossings with the pentagon are found
+        tolerance = max(snake_width, snake_height) / 2000.0
+        shapes = []
+        for path, attributes in zip(self.tile_paths, self.tile_attributes):
+            path = path.translated(offset)
+            split = split_segments(path, pentagon, tolerance)
+            if all(inside.all() for _, inside in split):
+                shapes.append((path, attributes))
+                continue
+            paint = paint_properties(attributes)
+            if painted(paint['fill']):
+                area = clip_area(split, pentagon, tolerance)
+                if len(area) > 0:
+                    shapes.append((area, add_style(attributes, "stroke:none")))
+            if painted(paint['stroke']):
+                stroke = clip_stroke(split)
+                if len(stroke) > 0:
+                    stroke_attributes = add_style(attributes, "fill:none")
+                    if attributes.get('id'):
+                        stroke_attributes['id'] = attributes['id'] + "_stroke"
+                    shapes.append((stroke, stroke_attributes))
+        path_data = [{'d': path.d(), 'style': attributes.get('style'),
+                      'id': attributes.get('id')} for path, attributes in shapes]
+        self._clipped_tiles[(dx, dy)] = shapes, path_data
+        return shapes, path_data
 
     def generate_tiling(self):
         dwg = Drawing("{}/tiling2.svg".format(self.output_folder), profile="tiny")
 
-        current_color = 0
         row_spacing = self.pent_height * 2 + self.bottom_length
+        if self.symbols:
+            for i, pent in enumerate(self.cairo_group):
+                dwg.defs.add(dwg.path(**{'d': pent.d(), 'id': "pentagon{}".format(i),
+                                         'stroke-width': 4, 'stroke': rgb(0, 0, 0)}))
 
+        # every row is the same, so the placements of the first are reused in each
+        row = self.lattice(num_down=1)
         for y in range(self.num_down):
             transform = "translate({}, {})".format(0, self.rep_spacing * y)
             dgroup = dwg.add(dwg.g(transform=transform))
             for x in range(self.num_across):
-                # if x is odd, point 1 of pent 1 needs to be attached to point 3 of pent 2
-                if x % 2 == 1:
-                    dx = int(x / 2) * self.rep_spacing + self.pent_width * 2 + self.column_offset.real
-                    transform = "translate({}, {})".format(dx, self.column_offset.imag)
-                else:
-                    transform = "translate({}, {})".format(int(x / 2) * self.rep_spacing, 0)
-                group = dgroup.add(dwg.g(transform=transform))
-                for pent in self.cairo_group:
-                    group.add(
-                        dwg.path(**{'d': pent.d(), 'fill': self._colors[current_color % len(self._colors)],
-                                    'stroke-width': 4, 'stroke': rgb(0, 0, 0)}))
-                    current_color += 1
+                offset = row.offsets[4 * x]
+                group = dgroup.add(dwg.g(transform="translate({}, {})".format(offset.real,
+                                                                              offset.imag)))
+                for i, pent in enumerate(self.cairo_group):
+                    color = row.colors[4 * x + i] + y * len(row.colors)
+                    fill = self.colors[color % len(self.colors)]
+                    if self.symbols:
+                        group.add(dwg.use("#pentagon{}".format(i), fill=fill))
+                    else:
+                        group.add(
+                            dwg.path(**{'d': pent.d(), 'fill': fill,
+                                        'stroke-width': 4, 'stroke': rgb(0, 0, 0)}))
 
         dwg.viewbox(*self.pattern_viewbox)
         dwg.save(pretty=True)
 
-    def draw_pattern(self):
+    def draw_pattern(self, dx=None, dy=None):
+        dx = self.dx if dx is None else dx
+        dy = self.dy if dy is None else dy
         self.output_filename = "{}/snake_tiling_m_{}_{}.svg".format(self.output_folder,
-                                                                    self.dx,
-                                                           self.dy)
+                                                                    dx, dy)
+        if self.scale != 1:
+            self.output_filename = self.output_filename.replace(
+                ".svg", "_s_{}.svg".format(self.scale))
+        key = self.render_key(dx, dy, "svg")
+        if self.cache is not None and self.cache.get_file(key, self.output_filename):
+            return self.output_filename
         dwg = Drawing(self.output_filename)
         # add background panel
         background_clippath = dwg.rect(insert=(self.pattern_viewbox[0], self.pattern_viewbox[1]),
@@ -242,69 +500,271 @@ class CairoTiler(object):
         clip_path.add(background_clippath)
         clipped_drawing = dwg.add(dwg.g(clip_path="url(#background_panel)", id="clippedpath"))
         clipped_drawing.add(background_panel)
-        current_color = 0
-
-        def add_pentagon(group, transform, current_color, draw_pent=True):
-            pent_group = group.add(dwg.g(transform=format_transform(*transform)))
-            if draw_pent:
-                pent_group.add(
-                    dwg.path(
-                        **{'d': self.new_pentagon().d(),
-                           'fill': self.colors[current_color % len(self.colors)],
-                           'stroke-width': 4, 'stroke': rgb(0, 0, 0)}))
-            return pent_group
-
-        for y in range(self.num_down):
-            transform = "translate({}, {})".format(0, self.rep_spacing * y)
-            dgroup = clipped_drawing.add(dwg.g(transform=transform))
-            for x in range(self.num_across):
-                # if x is odd, point 1 of pent 1 needs to be attached to point 3 of pent 2
-                if x % 2 == 1:
-                    dx = int(x / 2) * self.rep_spacing + self.pent_width * 2 + self.column_offset.real
-                    diff = dx + self.column_offset.imag * 1j
-                else:
-                    diff = int(x / 2) * self.rep_spacing
-                for i in range(4):
-                    snake_bbox = calc_overall_bbox(self.tile_paths)
-                    snake_width, snake_height = abs(snake_bbox[0] - snake_bbox[1]), \
-                                                abs(snake_bbox[2] - snake_bbox[3])
-                    pent_group = add_pentagon(dgroup,
-                                              (self.transforms[i][0], self.transforms[i][1] + diff),
-                                              current_color, draw_pent=False)
-                    for i, path in enumerate(self.tile_paths):
-                        stransform = 'translate({},{})'.format(snake_width * self.dx,
-                                                               snake_height * self.dy)
-                        pent_group.add(
-                            dwg.path(**{'d': path.d(),
-                                        'style': self.tile_attributes[i].get('style'),
-                                        'id': self.tile_attributes[i]['id'],
-                                        'transform': stransform}))
-                    current_color += 1
+        snake_width, snake_height = abs(self.tile_bbox[0] - self.tile_bbox[1]), \
+                                    abs(self.tile_bbox[2] - self.tile_bbox[3])
+        stransform = 'translate({},{})'.format(snake_width * dx, snake_height * dy)
+        path_data = self.tile_path_data
+        if self.clip:
+            # the clipped tile already has the offset applied
+            path_data = self.clipped_tile(dx, dy)[1]
+            stransform = None
+
+        if self.symbols:
+            # the tile is defined once, and each cell of the tiling is a single <use> of
+            # the four rotated pentagons that reference it
+            tile = dwg.defs.add(dwg.symbol(id="tile", overflow="visible"))
+            tile_group = tile.add(dwg.g() if stransform is None else dwg.g(transform=stransform))
+            for data in path_data:
+                tile_group.add(dwg.path(**data))
+            cairo_cell = dwg.defs.add(dwg.g(id="cairo_cell"))
+            for i, matrix in enumerate(self.lattice(1, 1).matrices):
+                pent_group = cairo_cell.add(
+                    dwg.g(id="pentagon{}".format(i), transform=format_matrix(matrix)))
+                pent_group.add(dwg.use("#tile"))
 
         dwg.viewbox(*self.pattern_viewbox)
-        dwg.save()
-
-    def export_png(self):
-        # this step requires that you have imagemagick working.
-        # this could be replaced with a python binding to imagemagick, however, these
-        # bindings cause python to crash on my computer.
-        dpi = 150
+        rows = self.visible_rows(dx, dy)
+        if self.stream:
+            self.stream_pattern(dwg, "clippedpath", path_data, stransform, rows)
+        else:
+            for y, placements in rows:
+                transform = "translate({}, {})".format(0, self.rep_spacing * y)
+                dgroup = clipped_drawing.add(dwg.g(transform=transform))
+                for element in self.pattern_cells(dwg, path_data, stransform, placements):
+                    dgroup.add(element)
+            dwg.save()
+        if self.cache is not None:
+            self.cache.put_file(key, self.output_filename)
+        return self.output_filename
+
+    def visible_rows(self, dx=None, dy=None):
+        """
+        the rows of draw_pattern that draw anything inside the pattern viewbox, as (row,
+        placements), with the placements as indices into the first row's lattice, which
+        every row shares
+        """
+        visible = self.visible_lattice(dx, dy)
+        placements = 4 * visible.columns + visible.pentagons
+        return [(y, placements[visible.rows == y]) for y in np.unique(visible.rows)]
+
+    def pattern_cells(self, dwg, path_data, stransform=None, placements=None):
+        """
+        the elements of one row of draw_pattern, created one placement at a time.
+        placements are the indices of the row's placements to create, and default to all
+        of them.
+        """
+        path_transform = {} if stransform is None else {'transform': stransform}
+        row = self.lattice(num_down=1)
+        placements = np.arange(len(row.matrices)) if placements is None else placements
+        if self.symbols:
+            # a cell is placed if any of its pentagons are visible
+            for offset in row.offsets[4 * np.unique(placements // 4)]:
+                yield dwg.use("#cairo_cell", transform="translate({}, {})".format(
+                    offset.real, offset.imag))
+            return
+        for matrix in row.matrices[placements]:
+            pent_group = dwg.g(transform=format_matrix(matrix))
+            for data in path_data:
+                pent_group.add(dwg.path(**dict(data, **path_transform)))
+            yield pent_group
+
+    def stream_pattern(self, dwg, rows_id, path_data, stransform=None, rows=None):
+        """
+        write draw_pattern's document with its rows written to the file as they are
+        generated, so that only one placement is held in memory at a time. dwg holds
+        everything but the rows, which go at the end of its group with the id rows_id.
+        rows are the (row, placements) to write, as from visible_rows, and default to all
+        of them.
+        """
+        # the document is split where the rows go with a marker, so that what is written
+        # before and after them doesn't depend on how svgwrite closes its elements
+        marker = "rows of the tiling"
+        document = dwg.get_xml()
+        group = document.find(".//*[@id='{}']".format(rows_id))
+        if len(group) > 0:
+            group[-1].tail = marker
+        else:
+            group.text = marker
+        prefix, closing = ElementTree.tostring(document, encoding="unicode").split(marker)
+        output = open(self.output_filename, "w")
+        output.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+        output.write(prefix)
+        rows = [(y, None) for y in range(self.num_down)] if rows is None else rows
+        for y, placements in rows:
+            output.write('<g transform="translate({}, {})">'.format(0, self.rep_spacing * y))
+            for element in self.pattern_cells(dwg, path_data, stransform, placements):
+                output.write(element.tostring())
+            output.write("</g>")
+        output.write(closing)
+        output.close()
+
+    def placement_matrices(self, lattice, dx=None, dy=None):
+        # the 3x3 matrix of each placement of the lattice, with the tile offset by dx and dy
+        dx = self.dx if dx is None else dx
+        dy = self.dy if dy is None else dy
+        snake_width, snake_height = abs(self.tile_bbox[0] - self.tile_bbox[1]), \
+                                    abs(self.tile_bbox[2] - self.tile_bbox[3])
+        offset = affine_matrix(1, 0, 0, 1, snake_width * dx, snake_height * dy)
+        matrices = np.zeros((len(lattice.matrices), 3, 3))
+        matrices[:, :2] = lattice.matrices
+        matrices[:, 2, 2] = 1
+        return np.matmul(matrices, offset)
+
+    def visible_lattice(self, dx=None, dy=None):
+        """
+        the placements of the lattice that draw anything inside the pattern viewbox. What
+        a placement draws is bounded by the drawn tile's bbox, padded by half of the
+        widest stroke.
+        """
+        dx = self.dx if dx is None else dx
+        dy = self.dy if dy is None else dy
+        if self.clip:
+            shapes = self.clipped_tile(dx, dy)[0]
+            if not shapes:
+                return self.lattice(num_down=0)
+            xmin, xmax, ymin, ymax = calc_overall_bbox([path for path, _ in shapes])
+        else:
+            shapes = list(zip(self.tile_paths, self.tile_attributes))
+            xmin, xmax, ymin, ymax = self.tile_bbox
+            offset = abs(xmax - xmin) * dx + abs(ymax - ymin) * dy * 1j
+            xmin, xmax = xmin + offset.real, xmax + offset.real
+            ymin, ymax = ymin + offset.imag, ymax + offset.imag
+        paints = [paint_properties(attributes) for _, attributes in shapes]
+        margin = max([parse_length(paint['stroke-width'], self.tile_viewbox) / 2.0
+                      for paint in paints if painted(paint['stroke'])] + [0])
+        bbox = [xmin - margin, xmax + margin, ymin - margin, ymax + margin]
+        return self.lattice(region=self.pattern_viewbox, bbox=bbox)
+
+    def export_png(self, filename=None, dx=None, dy=None):
+        filename = self.output_filename if filename is None else filename
+        dx = self.dx if dx is None else dx
+        dy = self.dy if dy is None else dy
+        dpi = self.dpi
         width_inches = 36 # one yard
+        if self.fabric_width is not None:
+            width_inches = max(self.fabric_width, self.fabric_length)
         size = dpi*width_inches
-        subprocess.call(['convert', self.output_filename, '-resize', '{}x{}'.format(size, size),
-                         self.output_filename.replace(".svg", ".png")])
+        png_filename = filename.replace(".svg", ".png")
+        rasterizer = self.rasterizer
+        if rasterizer == "scanline":
+            try:
+                for attributes in self.tile_attributes:
+                    parse_paint(attributes, self.tile_viewbox)
+            except ValueError as error:
+                print("{}, rendering {} with imagemagick instead".format(error, filename))
+                rasterizer = "imagemagick"
+        if rasterizer == "imagemagick":
+            # imagemagick renders the svg, so the png is keyed on the svg's contents
+            key = ("imagemagick", file_digest(filename), size)
+        else:
+            key = self.render_key(dx, dy, "png", size)
+        if self.cache is not None and self.cache.get_file(key, png_filename):
+            return
+        if rasterizer == "imagemagick":
+            # this step requires that you have imagemagick working.
+            # this could be replaced with a python binding to imagemagick, however, these
+            # bindings cause python to crash on my computer.
+            subprocess.call(['convert', filename, '-resize', '{}x{}'.format(size, size),
+                             png_filename])
+            if self.cache is not None and isfile(png_filename):
+                self.cache.put_file(key, png_filename)
+            return
+        # render the tiling from the tile geometry, without reading back the svg
+        lattice = self.visible_lattice(dx, dy)
+        if self.clip:
+            shapes = self.clipped_tile(dx, dy)[0]
+            placements = self.placement_matrices(lattice, 0, 0)
+        else:
+            shapes = list(zip(self.tile_paths, self.tile_attributes))
+            placements = self.placement_matrices(lattice, dx, dy)
+        render_png(png_filename, shapes, placements, self.pattern_viewbox, size,
+                   background='#3072a2', shape_viewbox=self.tile_viewbox)
+        if self.cache is not None:
+            self.cache.put_file(key, png_filename)
+
+    def scaled_tiler(self, scale):
+        # a copy of this tiler at another scale, reusing the imported tile
+        if scale == self.scale:
+            return self
+        tiler = copy(self)
+        tiler.scale = scale
+        tiler._tile_paths = [path.scaled(scale / float(self.scale)) for path in self.tile_paths]
+        for attribute in ("_tile_bbox", "_tile_path_data", "_tile_viewbox",
+                          "_clipped_tiles"):
+            if hasattr(tiler, attribute):
+                delattr(tiler, attribute)
+        return tiler
+
+    def sweep(self, dxs, dys, scales=None, jobs=None, export=False):
+        """
+        render a variant for every combination of dx, dy and scale in a process pool, and
+        write a contact sheet of the results. The tile is imported once and shared with
+        the workers.
+        """
+        scales = [self.scale] if scales is None else scales
+        tilers = {}
+        for scale in scales:
+            tiler = self.scaled_tiler(scale)
+            # compute everything that doesn't depend on dx and dy before sharing the tiler
+            tiler.tile_path_data
+            tiler.tile_bbox
+            tiler.tile_viewbox
+            tiler.transforms
+            tiler.pattern_viewbox
+            tilers[scale] = tiler
+        variants = [(dx, dy, scale, export) for scale in scales for dy in dys for dx in dxs]
+        pool = Pool(jobs, initializer=init_sweep_worker, initargs=(tilers,))
+        results = pool.map(render_variant, variants)
+        pool.close()
+        pool.join()
+        self.write_contact_sheet(results, export)
+        return results
+
+    def write_contact_sheet(self, results, export=False):
+        # an html index of sweep results, with a table of dy by dx for each scale
+        index_filename = "{}/sweep_{}.html".format(self.output_folder,
+            basename(self.filename).replace(".svg", ""))
+        lines = ["<html><body>"]
+        for scale in sorted(set(result['scale'] for result in results)):
+            scale_results = [result for result in results if result['scale'] == scale]
+            dxs = sorted(set(result['dx'] for result in scale_results))
+            dys = sorted(set(result['dy'] for result in scale_results))
+            cells = {(result['dx'], result['dy']): result for result in scale_results}
+            lines.append("<h2>scale {}</h2>".format(scale))
+            lines.append("<table><tr><th>dy \\ dx</th>{}</tr>".format(
+                "".join(["<th>{}</th>".format(dx) for dx in dxs])))
+            for dy in dys:
+                lines.append("<tr><th>{}</th>".format(dy))
+                for dx in dxs:
+                    result = cells.get((dx, dy))
+                    if result is None:
+                        lines.append("<td></td>")
+                        continue
+                    image = basename(result['filename'])
+                    if export:
+                        image = image.replace(".svg", ".png")
+                    lines.append('<td><a href="{0}"><img src="{0}" width="200"></a><br>'
+                                 '{1:.2f}s</td>'.format(image, result['time']))
+                lines.append("</tr>")
+            lines.append("</table>")
+        lines.append("</body></html>")
+        open(index_filename, "w").write("\n".join(lines))
+        return index_filename
 
     def ranged_diffs(self):
         ds = [0, 0.25, 0.5, 0.75, 1.0]
-        for adx in ds:
-            self.dx = adx
-            for ady in ds:
-                self.dy = ady
-                self.draw_pattern()
+        return self.sweep(ds, ds)
 
 
 if __name__ == "__main__":
-    args = parser.parse_args()
-    _tiler = CairoTiler(**vars(args))
-    _tiler.draw_pattern()
-    _tiler.export_png()
\ No newline at end of file
+    args = vars(parser.parse_args())
+    sweep_args = {key: args.pop(key)
+                  for key in ("sweep_dx", "sweep_dy", "sweep_scale", "jobs")}
+    _tiler = CairoTiler(**args)
+    if sweep_args["sweep_dx"] or sweep_args["sweep_dy"] or sweep_args["sweep_scale"]:
+        _tiler.sweep(sweep_args["sweep_dx"] or [_tiler.dx],
+                     sweep_args["sweep_dy"] or [_tiler.dy],
+                     sweep_args["sweep_scale"], jobs=sweep_args["jobs"], export=True)
+    else:
+        _tiler.draw_pattern()
+        _tiler.export_png()
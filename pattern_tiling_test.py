@@ -0,0 +1,102 @@
+# check that drawing a small motif renders the same as the reference svg: the same
+# visible elements, in the same order, with the same paint and the same geometry once their
+# transforms are applied. The drawing is clipped to its viewbox, so elements outside it
+# are left out of the comparison
+from os import chdir
+from os.path import abspath, dirname, join
+import re
+from tempfile import mkdtemp
+import xml.dom.minidom
+
+import numpy as np
+from svgpathtools import parse_path
+
+from pattern_tiling import CairoTiler, affine_matrix
+
+motif = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 200 200">
+<path id="p1" style="fill:#ff0000;stroke:none" d="M 10 10 C 50 0 80 40 100 100 L 20 150 Z"/>
+<path id="p2" style="fill:#00ff00" d="M 120 20 Q 180 60 150 180 L 110 120 Z"/>
+<path id="p3" style="fill:none;stroke:#000" d="M 0 190 L 190 190"/>
+</svg>
+"""
+reference_filename = join(dirname(abspath(__file__)), "pattern_tiling_reference.svg")
+painted = ("path", "rect")
+paint = ("style", "fill", "stroke", "stroke-width", "clip-path")
+# how far outside the viewbox an element can be and still be drawn, for its stroke
+margin = 10
+
+
+def parse_transform(value):
+    # the 3x3 matrix of an svg transform list of translates and matrices
+    matrix = np.eye(3)
+    for name, args in re.findall(r"(\w+)\(([^)]*)\)", value or ""):
+        args = [float(arg) for arg in re.split(r"[\s,]+", args.strip())]
+        if name == "translate":
+            args = [1, 0, 0, 1, args[0], args[1] if len(args) > 1 else 0]
+        assert name in ("translate", "matrix"), name
+        matrix = matrix.dot(affine_matrix(*args))
+    return matrix
+
+
+def points(element, matrix):
+    # the control points of a path, or the corners of a rect, with the matrix applied
+    if element.tagName == "path":
+        path = parse_path(element.getAttribute("d"))
+        corners = np.array([point for segment in path for point in segment.bpoints()])
+    else:
+        x, y, width, height = [element.getAttribute(name)
+                               for name in ("x", "y", "width", "height")]
+        # percentages are relative to the viewbox, so they are compared as they are
+        if width.endswith("%") or height.endswith("%"):
+            return np.array([float(x) + float(y) * 1j]), (width, height)
+        x, y, width, height = float(x), float(y), float(width), float(height)
+        corners = np.array([x + y * 1j, x + width + y * 1j, x + width + (y + height) * 1j])
+    transformed = matrix.dot(np.stack([corners.real, corners.imag, np.ones(len(corners))]))
+    return transformed[0] + transformed[1] * 1j, ()
+
+
+def shapes(node, matrix=np.eye(3)):
+    # every painted element below node, in document order
+    for child in node.childNodes:
+        if child.nodeType != child.ELEMENT_NODE:
+            continue
+        child_matrix = matrix.dot(parse_transform(child.getAttribute("transform")))
+        if child.tagName in painted:
+            yield (child.tagName, [child.getAttribute(name) for name in paint],
+                   points(child, child_matrix))
+        else:
+            for shape in shapes(child, child_matrix):
+                yield shape
+
+
+def visible(shape, viewbox):
+    corners = shape[2][0]
+    x, y, width, height = viewbox
+    return corners.real.max() >= x - margin and corners.real.min() <= x + width + margin \
+        and corners.imag.max() >= y - margin and corners.imag.min() <= y + height + margin
+
+
+def drawing(filename):
+    document = xml.dom.minidom.parse(filename).documentElement
+    viewbox = [float(value) for value in re.split(r"[\s,]+", document.getAttribute("viewBox"))]
+    return viewbox, [shape for shape in shapes(document) if visible(shape, viewbox)]
+
+
+chdir(mkdtemp(prefix="pattern_tiling_test"))
+with open("motif.svg", "w") as motif_file:
+    motif_file.write(motif)
+tiler = CairoTiler("motif.svg", dx=0.5, dy=0.25, repetitions=2)
+viewbox, drawn = drawing(tiler.draw_pattern())
+reference_viewbox, reference = drawing(reference_filename)
+
+assert np.allclose(viewbox, reference_viewbox), (viewbox, reference_viewbox)
+assert len(drawn) == len(reference), (len(drawn), len(reference))
+for i, (shape, reference_shape) in enumerate(zip(drawn, reference)):
+    (tag, attributes, (corners, extra)) = shape
+    (reference_tag, reference_attributes, (reference_corners, reference_extra)) = \
+        reference_shape
+    assert (tag, attributes, extra) == (reference_tag, reference_attributes,
+                                        reference_extra), (i, shape, reference_shape)
+    assert len(corners) == len(reference_corners) and np.allclose(
+        corners, reference_corners, atol=1e-6), (i, corners, reference_corners)
+print("{} visible elements match the reference".format(len(drawn)))
@@ -0,0 +1,301 @@
+from math import ceil, floor, sqrt
+import re
+import struct
+import zlib
+
+import numpy as np
+
+from utils import flatten_path
+
+# the svg color keywords, other colors need to be given as #rgb, #rrggbb or rgb()
+color_names = {
+    'aliceblue': (240, 248, 255), 'antiquewhite': (250, 235, 215), 'aqua': (0, 255, 255),
+    'aquamarine': (127, 255, 212), 'azure': (240, 255, 255), 'beige': (245, 245, 220),
+    'bisque': (255, 228, 196), 'black': (0, 0, 0), 'blanchedalmond': (255, 235, 205),
+    'blue': (0, 0, 255), 'blueviolet': (138, 43, 226), 'brown': (165, 42, 42),
+    'burlywood': (222, 184, 135), 'cadetblue': (95, 158, 160), 'chartreuse': (127, 255, 0),
+    'chocolate': (210, 105, 30), 'coral': (255, 127, 80), 'cornflowerblue': (100, 149, 237),
+    'cornsilk': (255, 248, 220), 'crimson': (220, 20, 60), 'cyan': (0, 255, 255),
+    'darkblue': (0, 0, 139), 'darkcyan': (0, 139, 139), 'darkgoldenrod': (184, 134, 11),
+    'darkgray': (169, 169, 169), 'darkgreen': (0, 100, 0), 'darkgrey': (169, 169, 169),
+    'darkkhaki': (189, 183, 107), 'darkmagenta': (139, 0, 139),
+    'darkolivegreen': (85, 107, 47), 'darkorange': (255, 140, 0),
+    'darkorchid': (153, 50, 204), 'darkred': (139, 0, 0), 'darksalmon': (233, 150, 122),
+    'darkseagreen': (143, 188, 143), 'darkslateblue': (72, 61, 139),
+    'darkslategray': (47, 79, 79), 'darkslategrey': (47, 79, 79),
+    'darkturquoise': (0, 206, 209), 'darkviolet': (148, 0, 211), 'deeppink': (255, 20, 147),
+    'deepskyblue': (0, 191, 255), 'dimgray': (105, 105, 105), 'dimgrey': (105, 105, 105),
+    'dodgerblue': (30, 144, 255), 'firebrick': (178, 34, 34), 'floralwhite': (255, 250, 240),
+    'forestgreen': (34, 139, 34), 'fuchsia': (255, 0, 255), 'gainsboro': (220, 220, 220),
+    'ghostwhite': (248, 248, 255), 'gold': (255, 215, 0), 'goldenrod': (218, 165, 32),
+    'gray': (128, 128, 128), 'grey': (128, 128, 128), 'green': (0, 128, 0),
+    'greenyellow': (173, 255, 47), 'honeydew': (240, 255, 240), 'hotpink': (255, 105, 180),
+    'indianred': (205, 92, 92), 'indigo': (75, 0, 130), 'ivory': (255, 255, 240),
+    'khaki': (240, 230, 140), 'lavender': (230, 230, 250), 'lavenderblush': (255, 240, 245),
+    'lawngreen': (124, 252, 0), 'lemonchiffon': (255, 250, 205),
+    'lightblue': (173, 216, 230), 'lightcoral': (240, 128, 128), 'lightcyan': (224, 255, 255),
+    'lightgoldenrodyellow': (250, 250, 210), 'lightgray': (211, 211, 211),
+    'lightgreen': (144, 238, 144), 'lightgrey': (211, 211, 211), 'lightpink': (255, 182, 193),
+    'lightsalmon': (255, 160, 122), 'lightseagreen': (32, 178, 170),
+    'lightskyblue': (135, 206, 250), 'lightslategray': (119, 136, 153),
+    'lightslategrey': (119, 136, 153), 'lightsteelblue': (176, 196, 222),
+    'lightyellow': (255, 255, 224), 'lime': (0, 255, 0), 'limegreen': (50, 205, 50),
+    'linen': (250, 240, 230), 'magenta': (255, 0, 255), 'maroon': (128, 0, 0),
+    'mediumaquamarine': (102, 205, 170), 'mediumblue': (0, 0, 205),
+    'mediumorchid': (186, 85, 211), 'mediumpurple': (147, 112, 219),
+    'mediumseagreen': (60, 179, 113), 'mediumslateblue': (123, 104, 238),
+    'mediumspringgreen': (0, 250, 154), 'mediumturquoise': (72, 209, 204),
+    'mediumvioletred': (199, 21, 133), 'midnightblue': (25, 25, 112),
+    'mintcream': (245, 255, 250), 'mistyrose': (255, 228, 225), 'moccasin': (255, 228, 181),
+    'navajowhite': (255, 222, 173), 'navy': (0, 0, 128), 'oldlace': (253, 245, 230),
+    'olive': (128, 128, 0), 'olivedrab': (107, 142, 35), 'orange': (255, 165, 0),
+    'orangered': (255, 69, 0), 'orchid': (218, 112, 214), 'palegoldenrod': (238, 232, 170),
+    'palegreen': (152, 251, 152), 'paleturquoise': (175, 238, 238),
+    'palevioletred': (219, 112, 147), 'papayawhip': (255, 239, 213),
+    'peachpuff': (255, 218, 185), 'peru': (205, 133, 63), 'pink': (255, 192, 203),
+    'plum': (221, 160, 221), 'powderblue': (176, 224, 230), 'purple': (128, 0, 128),
+    'red': (255, 0, 0), 'rosybrown': (188, 143, 143), 'royalblue': (65, 105, 225),
+    'saddlebrown': (139, 69, 19), 'salmon': (250, 128, 114), 'sandybrown': (244, 164, 96),
+    'seagreen': (46, 139, 87), 'seashell': (255, 245, 238), 'sienna': (160, 82, 45),
+    'silver': (192, 192, 192), 'skyblue': (135, 206, 235), 'slateblue': (106, 90, 205),
+    'slategray': (112, 128, 144), 'slategrey': (112, 128, 144), 'snow': (255, 250, 250),
+    'springgreen': (0, 255, 127), 'steelblue': (70, 130, 180), 'tan': (210, 180, 140),
+    'teal': (0, 128, 128), 'thistle': (216, 191, 216), 'tomato': (255, 99, 71),
+    'turquoise': (64, 224, 208), 'violet': (238, 130, 238), 'wheat': (245, 222, 179),
+    'white': (255, 255, 255), 'whitesmoke': (245, 245, 245), 'yellow': (255, 255, 0),
+    'yellowgreen': (154, 205, 50)}
+
+
+def parse_color(value):
+    """
+    an svg color as an (r, g, b) array of 0-255 floats, or None for none/transparent.
+    Paints the rasterizer can't draw, like currentColor or url(#gradient), raise a
+    ValueError.
+    """
+    value = value.strip().lower() if value else "none"
+    if value in ("none", "transparent"):
+        return None
+    if value in color_names:
+        return np.array(color_names[value], dtype=float)
+    if value.startswith("#"):
+        digits = value[1:]
+        if len(digits) == 3:
+            digits = "".join([d * 2 for d in digits])
+        return np.array([int(digits[i:i + 2], 16) for i in (0, 2, 4)], dtype=float)
+    parsed = re.match(r"rgb\(([^,]+),([^,]+),([^)]+)\)", value.replace(" ", ""))
+    if parsed:
+        parts = [parsed.group(i) for i in range(1, 4)]
+        return np.array([float(p[:-1]) * 2.55 if p.endswith("%") else float(p)
+                         for p in parts], dtype=float)
+    raise ValueError("the scanline rasterizer can't paint {}".format(value))
+
+
+def painted(value):
+    # whether an svg paint draws anything, without parsing its color
+    return (value or "none").strip().lower() not in ("none", "transparent")
+
+
+def parse_length(value, viewbox=None):
+    """
+    an svg length in user units, ignoring unit suffixes. Percentages are of the diagonal
+    of the (x, y, width, height) viewbox, as the svg spec has it for stroke-width, and
+    raise a ValueError without one.
+    """
+    value = value.strip()
+    if value.endswith("%"):
+        if viewbox is None:
+            raise ValueError("the length {} is relative to a viewbox, but there is "
+                             "none".format(value))
+        return float(value[:-1]) / 100.0 * sqrt((viewbox[2] ** 2 + viewbox[3] ** 2) / 2.0)
+    return float(re.sub("[a-z]+$", "", value))
+
+
+def paint_properties(attributes):
+    # the unparsed paint properties of an svg element from its attributes and style
+    properties = {'fill': 'black', 'stroke': 'none', 'stroke-width': '1',
+                  'fill-rule': 'nonzero', 'opacity': '1', 'fill-opacity': '1',
+                  'stroke-opacity': '1'}
+    for key in properties:
+        if key in attributes:
+            properties[key] = attributes[key]
+    for declaration in (attributes.get('style') or "").split(";"):
+        if ":" in declaration:
+            key, value = [part.strip() for part in declaration.split(":", 1)]
+            if key in properties:
+                properties[key] = value
+    return properties
+
+
+def parse_paint(attributes, viewbox=None):
+    """
+    the paint properties of an svg element from its attributes and style. Only what the
+    rasterizer supports is read: fill, stroke, their opacities, stroke-width and fill-rule.
+    viewbox is that of the element's svg, for percentage stroke widths.
+    """
+    properties = paint_properties(attributes)
+    opacity = float(properties['opacity'])
+    return {'fill': parse_color(properties['fill']),
+            'stroke': parse_color(properties['stroke']),
+            'stroke-width': parse_length(properties['stroke-width'], viewbox),
+            'fill-rule': properties['fill-rule'],
+            'fill-opacity': opacity * float(properties['fill-opacity']),
+            'stroke-opacity': opacity * float(properties['stroke-opacity'])}
+
+
+def fill_edges(subpaths):
+    # the (start, end) of every edge of the subpaths, each closed back to its start
+    edges = [np.stack([subpath, np.roll(subpath, -1)], axis=1) for subpath in subpaths
+             if len(subpath) > 2]
+    return np.concatenate(edges) if edges else np.zeros((0, 2), dtype=complex)
+
+
+def stroke_edges(subpaths, width):
+    """
+    the edges of a rectangle around each piece of the polylines, extended by half the
+    width at both ends to cover the joins. All rectangles have the same orientation, so
+    their union is what the nonzero fill rule fills.
+    """
+    edges = []
+    for subpath in subpaths:
+        starts, ends = subpath[:-1], subpath[1:]
+        direction = ends - starts
+        length = np.abs(direction)
+        keep = length > 0
+        starts, ends, direction = starts[keep], ends[keep], direction[keep] / length[keep]
+        along = direction * width / 2.0
+        normal = along * 1j
+        corners = [starts - along + normal, ends + along + normal,
+                   ends + along - normal, starts - along - normal]
+        for i in range(4):
+            edges.append(np.stack([corners[i], corners[(i + 1) % 4]], axis=1))
+    return np.concatenate(edges) if edges else np.zeros((0, 2), dtype=complex)
+
+
+def transform_points(matrix, points):
+    # apply a 3x3 affine matrix to an array of complex points
+    return (matrix[0, 0] * points.real + matrix[0, 1] * points.imag + matrix[0, 2]) + \
+        1j * (matrix[1, 0] * points.real + matrix[1, 1] * points.imag + matrix[1, 2])
+
+
+def edges_bbox(edges):
+    # the [xmin, xmax, ymin, ymax] of an array of edges, or None if there are none
+    if len(edges) == 0:
+        return None
+    return [edges.real.min(), edges.real.max(), edges.imag.min(), edges.imag.max()]
+
+
+def paint_edges(canvas, top, edges, color, alpha=1.0, rule="nonzero"):
+    """
+    fill the region bounded by edges (in pixel coordinates) into a strip of the canvas
+    that starts at pixel row top, by summing the winding number of the edges crossing
+    the center of every pixel in a scanline.
+    """
+    rows, width = canvas.shape[0:2]
+    xmin, xmax, ymin, ymax = edges_bbox(edges)
+    row_start, row_end = max(int(floor(ymin)), top), min(int(ceil(ymax)), top + rows)
+    col_start, col_end = max(int(floor(xmin)), 0), min(int(ceil(xmax)), width)
+    if row_start >= row_end or col_start >= col_end:
+        return
+    y0, y1 = edges[:, 0].imag, edges[:, 1].imag
+    x0, x1 = edges[:, 0].real, edges[:, 1].real
+    centers = np.arange(row_start, row_end) + 0.5
+    crossing = (centers[:, None] >= np.minimum(y0, y1)) & (centers[:, None] < np.maximum(y0, y1))
+    row_index, edge_index = np.nonzero(crossing)
+    y0, y1 = y0[edge_index], y1[edge_index]
+    x0, x1 = x0[edge_index], x1[edge_index]
+    x = x0 + (centers[row_index] - y0) * (x1 - x0) / (y1 - y0)
+    columns = np.clip(np.ceil(x - 0.5).astype(int) - col_start, 0, col_end - col_start)
+    winding = np.zeros((row_end - row_start, col_end - col_start + 1), dtype=int)
+    np.add.at(winding, (row_index, columns), np.where(y1 > y0, 1, -1))
+    winding = np.cumsum(winding, axis=1)[:, :-1]
+    covered = winding % 2 == 1 if rule == "evenodd" else winding != 0
+    region = canvas[row_start - top:row_end - top, col_start:col_end]
+    if alpha >= 1.0:
+        region[covered] = color
+    else:
+        region[covered] = region[covered] * (1 - alpha) + color * alpha
+
+
+class PngWriter(object):
+    """
+    write an 8-bit rgb png a strip of rows at a time, so that the whole image never has to
+    be held in memory
+    """
+    def __init__(self, filename, width, height):
+        self.width = width
+        self.file = open(filename, "wb")
+        self.compressor = zlib.compressobj()
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self.write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def write_chunk(self, chunk_type, data):
+        self.file.write(struct.pack(">I", len(data)) + chunk_type + data)
+        self.file.write(struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff))
+
+    def write_rows(self, rows):
+        # every row is prefixed by filter type 0 (none)
+        rows = np.asarray(rows, dtype=np.uint8).reshape(len(rows), self.width * 3)
+        data = np.concatenate([np.zeros((len(rows), 1), dtype=np.uint8), rows], axis=1)
+        compressed = self.compressor.compress(data.tobytes())
+        if compressed:
+            self.write_chunk(b"IDAT", compressed)
+
+    def close(self):
+        self.write_chunk(b"IDAT", self.compressor.flush())
+        self.write_chunk(b"IEND", b"")
+        self.file.close()
+
+
+def render_png(filename, shapes, placements, viewbox, size, background=None,
+               strip_height=256, supersample=1, shape_viewbox=None):
+    """
+    rasterize copies of shapes to a png that fits in size x size pixels.
+    shapes is a list of (svgpathtools path, attributes) and placements an array of 3x3
+    affine matrices, each of which places every shape once, in order. viewbox is the
+    (x, y, width, height) of the region to render, and shape_viewbox that of the svg the
+    shapes came from, for percentage stroke widths. The image is drawn in horizontal
+    strips of strip_height rows to bound the memory used.
+    """
+    scale = float(size) / max(viewbox[2], viewbox[3])
+    width, height = int(round(viewbox[2] * scale)), int(round(viewbox[3] * scale))
+    pixel_scale = scale * supersample
+    to_pixels = np.array([[pixel_scale, 0, -viewbox[0] * pixel_scale],
+                          [0, pixel_scale, -viewbox[1] * pixel_scale], [0, 0, 1]])
+    placements = np.matmul(to_pixels, placements)
+    # flatten each shape once, in its own coordinates
+    layers = []
+    for path, attributes in shapes:
+        paint = parse_paint(attributes, shape_viewbox)
+        subpaths = flatten_path(path, 1.0 / pixel_scale)
+        if paint['fill'] is not None:
+            layers.append((fill_edges(subpaths), paint['fill'], paint['fill-opacity'],
+                           paint['fill-rule']))
+        if paint['stroke'] is not None and paint['stroke-width'] > 0:
+            layers.append((stroke_edges(subpaths, paint['stroke-width']), paint['stroke'],
+                           paint['stroke-opacity'], "nonzero"))
+    layers = [layer for layer in layers if len(layer[0]) > 0]
+    # the pixel rows covered by each layer at each placement, to skip them in other strips.
+    # An affine transform of a layer's bbox contains the transformed layer, so only its
+    # corners are transformed here, and the edges only for the strips they are drawn in
+    bboxes = np.array([edges_bbox(layer[0]) for layer in layers]).reshape(-1, 4)
+    corners = bboxes[:, [0, 1, 0, 1]] + 1j * bboxes[:, [2, 2, 3, 3]]
+    rows = placements[:, 1, 0, None, None] * corners.real + \
+        placements[:, 1, 1, None, None] * corners.imag + placements[:, 1, 2, None, None]
+    row_ranges = np.stack([rows.min(axis=2), rows.max(axis=2)], axis=2)
+    background = parse_color(background)
+    writer = PngWriter(filename, width, height)
+    for strip_top in range(0, height, strip_height):
+        rows = min(strip_height, height - strip_top)
+        top = strip_top * supersample
+        canvas = np.empty((rows * supersample, width * supersample, 3))
+        canvas[:] = 255 if background is None else background
+        visible = (row_ranges[:, :, 1] >= top) & (row_ranges[:, :, 0] < top + len(canvas))
+        for i, j in zip(*np.nonzero(visible)):
+            edges, color, alpha, rule = layers[j]
+            paint_edges(canvas, top, transform_points(placements[i], edges), color, alpha,
+                        rule)
+        if supersample > 1:
+            canvas = canvas.reshape(rows, supersample, width, supersample, 3).mean(axis=(1, 3))
+        writer.write_rows(np.round(canvas))
+    writer.close()
+    return filename
@@ -0,0 +1,91 @@
+from collections import namedtuple
+import argparse
+
+import numpy as np
+from scipy.spatial import cKDTree
+from svgpathtools import svg2paths
+
+from utils import calc_overall_bbox
+
+parser = argparse.ArgumentParser(
+    description='Find the seams two pattern pieces share, as runs of segments that line up')
+parser.add_argument('--filename', type=str,
+                    help='The filename of the svg with at least two pattern pieces.')
+parser.add_argument('--tolerance', type=float,
+                    help="How far apart the ends of two segments can be for them to be on "
+                         "the same seam (defaults to 1%% of the size of the pieces).")
+
+# a run of length segments from start0 of the first path and start1 of the second that
+# line up, in the opposite order in the second path if reverse is set
+Seam = namedtuple("Seam", ["start0", "start1", "length", "reverse"])
+
+
+def segment_ends(path):
+    # the start and end points of each segment of a path, as complex arrays
+    return np.array([segment.start for segment in path], dtype=complex), \
+        np.array([segment.end for segment in path], dtype=complex)
+
+
+def nearest_segments(tree, points, ends, other_ends, tolerance):
+    # the segment with the point in tree nearest to each of points, if it is within
+    # tolerance and the segment's other end is also within tolerance of the matching end
+    distances, nearest = tree.query(np.stack([points.real, points.imag], axis=1),
+                                    distance_upper_bound=tolerance)
+    matched = np.isfinite(distances)
+    nearest = np.where(matched, nearest, 0)
+    matched &= np.abs(other_ends[nearest] - ends) <= tolerance
+    return np.where(matched, nearest, -1)
+
+
+def runs(matches, step, count):
+    """
+    the (start, length) of each run of segments whose matches follow on from each other
+    by step, going around the closed path, longest first
+    """
+    num_segments = len(matches)
+    following = (matches + step) % count
+    linked = (matches >= 0) & (np.roll(matches, -1) == following)
+    if linked.all():
+        return [(0, num_segments)]
+    breaks = np.nonzero(~linked)[0]
+    starts = (breaks + 1) % num_segments
+    lengths = np.diff(np.append(breaks, breaks[0] + num_segments))
+    found = [(start, length) for start, length in zip(starts.tolist(), lengths.tolist())
+             if matches[start] >= 0]
+    return sorted(found, key=lambda run: -run[1])
+
+
+def find_seams(path0, path1, tolerance=None):
+    """
+    the runs of segments of path1 that line up with a run of segments of path0, end to
+    end within tolerance, in either direction, as a list of Seams, longest first. Each
+    segment of path1 is matched to the nearest start (or end, for seams that run the
+    other way) of a segment of path0 with a kd-tree.
+    """
+    if len(path0) == 0 or len(path1) == 0:
+        return []
+    if tolerance is None:
+        bbox = calc_overall_bbox(list(path0) + list(path1))
+        tolerance = 0.01 * max(abs(bbox[1] - bbox[0]), abs(bbox[3] - bbox[2]))
+    starts0, ends0 = segment_ends(path0)
+    starts1, ends1 = segment_ends(path1)
+    seams = []
+    for reverse, points0, other_ends0 in ((False, starts0, ends0), (True, ends0, starts0)):
+        tree = cKDTree(np.stack([points0.real, points0.imag], axis=1))
+        matches = nearest_segments(tree, starts1, ends1, other_ends0, tolerance)
+        step = -1 if reverse else 1
+        for start, length in runs(matches, step, len(path0)):
+            start0 = matches[start] if not reverse else \
+                (matches[start] - length + 1) % len(path0)
+            seams.append(Seam(int(start0), start, length, reverse))
+    return sorted(seams, key=lambda seam: -seam.length)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    all_paths, attributes = svg2paths(args.filename)
+    for seam in find_seams(all_paths[0], all_paths[1], args.tolerance):
+        print("segments {}-{} of the first piece and {}-{} of the second{}".format(
+            seam.start0, (seam.start0 + seam.length - 1) % len(all_paths[0]), seam.start1,
+            (seam.start1 + seam.length - 1) % len(all_paths[1]),
+            ", reversed" if seam.reverse else ""))
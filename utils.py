@@ -1,18 +1,415 @@
+from math import ceil, pi, sqrt
+
+import numpy as np
+from svgpathtools import Arc, Line, Path
 from svgwrite import rgb
 
+# binomial coefficients for the bernstein polynomials of lines, quadratics and cubics
+binomials = [[1], [1, 1], [1, 2, 1], [1, 3, 3, 1]]
+
+
+def bezier_point(control_points, t):
+    # evaluate an array of bezier curves, one row of complex control points each, at t
+    degree = control_points.shape[1] - 1
+    t = t[:, None]
+    weights = [binomials[degree][i] * (1 - t) ** (degree - i) * t ** i
+               for i in range(degree + 1)]
+    return (np.concatenate(weights, axis=1) * control_points).sum(axis=1)
+
+
+def bezier_extrema(control_points):
+    """
+    the points where an array of bezier curves (one row of complex control points each)
+    has a horizontal or vertical tangent for 0 < t < 1, as one row per curve. Where there
+    is no such point, the start point of the curve is given instead.
+    """
+    degree = control_points.shape[1] - 1
+    if degree < 2:
+        return control_points[:, :1]
+    derivative = degree * np.diff(control_points, axis=1)
+    extrema = []
+    for part in (derivative.real, derivative.imag):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if degree == 2:
+                ts = [part[:, 0] / (part[:, 0] - part[:, 1])]
+            else:
+                # the derivative of a cubic is a*t^2 + b*t + c
+                a = part[:, 0] - 2 * part[:, 1] + part[:, 2]
+                b = 2 * (part[:, 1] - part[:, 0])
+                c = part[:, 0]
+                root = np.sqrt(b * b - 4 * a * c)
+                quadratic = np.abs(a) > 1e-12
+                ts = [np.where(quadratic, (-b + root) / (2 * a), -c / b),
+                      np.where(quadratic, (-b - root) / (2 * a), np.nan)]
+        for t in ts:
+            t = np.where(np.isfinite(t) & (t > 0) & (t < 1), t, 0)
+            extrema.append(bezier_point(control_points, t))
+    return np.stack(extrema, axis=1)
+
+
+def points_bboxes(points):
+    # the [xmin, xmax, ymin, ymax] of each row of an array of complex points
+    return np.stack([points.real.min(axis=1), points.real.max(axis=1),
+                     points.imag.min(axis=1), points.imag.max(axis=1)], axis=1)
+
+
+def segment_bboxes(segments):
+    """
+    an (n, 4) array of the [xmin, xmax, ymin, ymax] of each svgpathtools segment. The
+    extrema of all curves of the same degree are solved at once.
+    """
+    bboxes = np.empty((len(segments), 4))
+    by_degree = {}
+    for i, segment in enumerate(segments):
+        if isinstance(segment, Arc):
+            bboxes[i] = segment.bbox()
+            continue
+        control_points = segment.bpoints()
+        indices, rows = by_degree.setdefault(len(control_points), ([], []))
+        indices.append(i)
+        rows.append(control_points)
+    for indices, rows in by_degree.values():
+        control_points = np.array(rows, dtype=complex)
+        bboxes[indices] = points_bboxes(np.concatenate(
+            [control_points[:, [0, -1]], bezier_extrema(control_points)], axis=1))
+    return bboxes
+
+
+def combine_bboxes(bboxes):
+    if len(bboxes) == 0:
+        return None
+    bboxes = np.asarray(bboxes)
+    return [float(bboxes[:, 0].min()), float(bboxes[:, 1].max()),
+            float(bboxes[:, 2].min()), float(bboxes[:, 3].max())]
+
+
+def cached_bbox(path):
+    # the bbox cached on a path, if it still holds the same segments
+    cached = getattr(path, "_bbox_cache", None)
+    if cached is None or len(cached[0]) != len(path):
+        return None
+    if not all(a is b for a, b in zip(cached[0], path)):
+        return None
+    return cached[1]
+
+
 def calc_overall_bbox(paths):
-    overall_bbox = None
+    """
+    the [xmin, xmax, ymin, ymax] of a list of svgpathtools paths and/or segments. The
+    bbox of each Path is cached on it, and reused while it holds the same segments.
+    """
+    bboxes = []
+    segments = []
+    uncached = []
     for path in paths:
-        shape = path
-        bbox = shape.bbox()
-        xmin, xmax = min(bbox[0], bbox[1]), max(bbox[0], bbox[1])
-        ymin, ymax = min(bbox[2], bbox[3]), max(bbox[2], bbox[3])
-        if overall_bbox is None:
-            overall_bbox = [xmin, xmax, ymin, ymax]
-        else:
-            overall_bbox = [min(xmin, overall_bbox[0]), max(xmax, overall_bbox[1]),
-                            min(ymin, overall_bbox[2]), max(ymax, overall_bbox[3])]
-    return overall_bbox
+        if not isinstance(path, Path):
+            segments.append(path)
+            continue
+        bbox = cached_bbox(path)
+        if bbox is not None:
+            bboxes.append(bbox)
+        elif len(path) > 0:
+            uncached.append((path, len(segments)))
+            segments.extend(path)
+    if len(segments) == 0:
+        return combine_bboxes(bboxes)
+    all_bboxes = segment_bboxes(segments)
+    loose = np.ones(len(segments), dtype=bool)
+    for path, start in uncached:
+        path_bboxes = all_bboxes[start:start + len(path)]
+        loose[start:start + len(path)] = False
+        bbox = combine_bboxes(path_bboxes)
+        path._bbox_cache = tuple(path), bbox
+        bboxes.append(bbox)
+    return combine_bboxes(bboxes + list(all_bboxes[loose]))
+
+
+def segment_ts(segment, tolerance, t0=0.0, t1=1.0):
+    """
+    the values of t from t0 to t1 that cut a svgpathtools segment into the fewest pieces
+    that are guaranteed to stay within tolerance of it when replaced by lines. They are
+    evenly spaced, and their number comes from Wang's bound on the second differences of
+    the control points for beziers, and from the sagitta of the pieces for arcs.
+    """
+    if isinstance(segment, Arc):
+        radius = max(segment.radius.real, segment.radius.imag)
+        sweep = abs(np.radians(segment.delta)) * (t1 - t0)
+        step = 2 * np.arccos(1 - tolerance / radius) if tolerance < radius else pi
+        return np.linspace(t0, t1, int(max(ceil(sweep / step), 1)) + 1)
+    control_points = np.array(segment.bpoints(), dtype=complex)
+    degree = len(control_points) - 1
+    num_pieces = 1
+    if degree > 1:
+        second_differences = np.abs(np.diff(control_points, 2)).max()
+        num_pieces = max(ceil((t1 - t0) * sqrt(
+            degree * (degree - 1) / 8.0 * second_differences / tolerance)), 1)
+    return np.linspace(t0, t1, int(num_pieces) + 1)
+
+
+def segment_points(segment, ts):
+    # the points of a svgpathtools segment at an array of t
+    if isinstance(segment, Arc):
+        return np.array([segment.point(t) for t in ts])
+    control_points = np.array(segment.bpoints(), dtype=complex)
+    return bezier_point(np.repeat(control_points[None, :], len(ts), axis=0), ts)
+
+
+def flatten_segment(segment, tolerance, t0=0.0, t1=1.0):
+    """
+    approximate the part of a svgpathtools segment from t0 to t1 by a polyline whose
+    pieces are never further than tolerance from the curve, as a complex array of points
+    from the point at t0 to the point at t1.
+    """
+    return segment_points(segment, segment_ts(segment, tolerance, t0, t1))
+
+
+def flatten_segments(path, tolerance):
+    """
+    the lines that approximate every segment of a svgpathtools path to within tolerance,
+    as arrays of their starts and ends, the index of the segment they are on, and the t
+    on that segment of their starts and ends
+    """
+    starts, ends, indices, t0s, t1s = [], [], [], [], []
+    for index, segment in enumerate(path):
+        ts = segment_ts(segment, tolerance)
+        points = segment_points(segment, ts)
+        starts.append(points[:-1])
+        ends.append(points[1:])
+        indices.append(np.full(len(ts) - 1, index))
+        t0s.append(ts[:-1])
+        t1s.append(ts[1:])
+    return [np.concatenate(part) for part in (starts, ends, indices, t0s, t1s)]
+
+
+def flatten_path(path, pixel_size=1.0):
+    """
+    approximate a svgpathtools path by polylines, one complex array per continuous
+    subpath, that are within a quarter of pixel_size of the curves.
+    """
+    subpaths = []
+    points = []
+    for segment in path:
+        if len(points) > 0 and abs(segment.start - points[-1][-1]) > 1e-9:
+            subpaths.append(np.concatenate(points))
+            points = []
+        if len(points) == 0:
+            points.append(np.array([segment.start]))
+        points.append(flatten_segment(segment, pixel_size / 4.0)[1:])
+    if len(points) > 0:
+        subpaths.append(np.concatenate(points))
+    return subpaths
+
+
+def cross(u, v):
+    # the z component of the cross product of complex numbers as 2d vectors
+    return u.real * v.imag - u.imag * v.real
+
+
+def refine_intersection(segment, t, start, direction, iterations=8):
+    # newton's method for the t where a svgpathtools segment crosses a line
+    for _ in range(iterations):
+        slope = cross(direction, segment.derivative(t))
+        if slope == 0:
+            break
+        step = cross(direction, segment.point(t) - start) / slope
+        t -= step
+        if abs(step) < 1e-12:
+            break
+    return t
+
+
+def intersect_lines(path, starts, ends, tolerance, block_size=32):
+    """
+    every intersection of the lines from starts to ends (complex arrays) with a
+    svgpathtools path, found in one batch. The path is flattened to within tolerance
+    once, and its lines grouped into blocks of block_size consecutive lines. The lines are
+    tested against the bbox of each block before the lines in the blocks they reach, and
+    each intersection is refined on the segment itself. Crossings that are within
+    tolerance of each other where the path grazes a line can be missed. Returns arrays
+    of the index of the line, the index of the segment and the t on the segment of each
+    intersection, sorted by line, then by position along the path.
+    """
+    if len(path) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+    piece_starts, piece_ends, indices, t0s, t1s = flatten_segments(path, tolerance)
+    num_pieces = len(piece_starts)
+    block_starts = np.arange(0, num_pieces, block_size)
+    piece_points = np.stack([piece_starts, piece_ends], axis=1)
+    block_bboxes = np.stack([np.minimum.reduceat(piece_points.real.min(axis=1), block_starts),
+                             np.maximum.reduceat(piece_points.real.max(axis=1), block_starts),
+                             np.minimum.reduceat(piece_points.imag.min(axis=1), block_starts),
+                             np.maximum.reduceat(piece_points.imag.max(axis=1), block_starts)],
+                            axis=1)
+    # a line can only reach a block if their bboxes overlap, and the block's corners are
+    # not all on the same side of it
+    starts, ends = np.asarray(starts, dtype=complex), np.asarray(ends, dtype=complex)
+    directions = ends - starts
+    overlap = (np.maximum(starts.real, ends.real)[:, None] >= block_bboxes[:, 0]) & \
+              (np.minimum(starts.real, ends.real)[:, None] <= block_bboxes[:, 1]) & \
+              (np.maximum(starts.imag, ends.imag)[:, None] >= block_bboxes[:, 2]) & \
+              (np.minimum(starts.imag, ends.imag)[:, None] <= block_bboxes[:, 3])
+    corners = [block_bboxes[:, x] + 1j * block_bboxes[:, y] for x in (0, 1) for y in (2, 3)]
+    sides = np.stack([np.sign(cross(directions[:, None], corner[None, :] - starts[:, None]))
+                      for corner in corners])
+    overlap &= (sides.max(axis=0) >= 0) & (sides.min(axis=0) <= 0)
+    lines, blocks = np.nonzero(overlap)
+    pieces = block_starts[blocks][:, None] + np.arange(block_size)
+    lines = np.repeat(lines, block_size)
+    pieces = pieces.ravel()
+    lines, pieces = lines[pieces < num_pieces], pieces[pieces < num_pieces]
+    # intersect each line with the pieces of the blocks it reaches
+    offsets = piece_starts[pieces] - starts[lines]
+    piece_directions = piece_ends[pieces] - piece_starts[pieces]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = cross(directions[lines], piece_directions)
+        along_line = cross(offsets, piece_directions) / denominator
+        along_piece = cross(offsets, directions[lines]) / denominator
+    # the end of each piece is the start of the next, except for the last
+    last = pieces == num_pieces - 1
+    hits = (denominator != 0) & (along_line >= 0) & (along_line <= 1) & \
+        (along_piece >= 0) & ((along_piece < 1) | (last & (along_piece <= 1)))
+    lines, pieces, along_piece = lines[hits], pieces[hits], along_piece[hits]
+    segments = indices[pieces]
+    ts = t0s[pieces] + along_piece * (t1s[pieces] - t0s[pieces])
+    for k in range(len(ts)):
+        refined = refine_intersection(path[segments[k]], ts[k], starts[lines[k]],
+                                      directions[lines[k]])
+        # keep the estimate if newton's method wandered off to another crossing
+        width = (t1s[pieces[k]] - t0s[pieces[k]]) / 2.0
+        if t0s[pieces[k]] - width <= refined <= t1s[pieces[k]] + width:
+            ts[k] = min(max(refined, 0.0), 1.0)
+    order = np.lexsort((ts, segments, lines))
+    lines, segments, ts = lines[order], segments[order], ts[order]
+    # neighbouring pieces can refine to the same crossing
+    unique = np.ones(len(ts), dtype=bool)
+    unique[1:] = (np.diff(lines) != 0) | (np.diff(segments) != 0) | (np.diff(ts) > 1e-9)
+    return lines[unique], segments[unique], ts[unique]
+
+
+def convex_edges(clip):
+    # the edges of a convex polygon, ordered so that its inside is on their left
+    area = cross(clip, np.roll(clip, -1)).sum()
+    if area < 0:
+        clip = clip[::-1]
+    return zip(clip, np.roll(clip, -1))
+
+
+def inside_convex(points, clip):
+    # whether each of an array of complex points is inside (or on) a convex polygon
+    inside = np.ones(np.shape(points), dtype=bool)
+    for a, b in convex_edges(clip):
+        inside &= cross(b - a, points - a) >= 0
+    return inside
+
+
+def winding_number(points, centre):
+    # how many times the closed polygon through an array of complex points goes around centre
+    offsets = points - centre
+    return int(round(np.angle(np.roll(offsets, -1) / offsets).sum() / (2 * pi)))
+
+
+def polyline_lines(points):
+    # svgpathtools lines through an array of complex points, skipping repeated points
+    points = points.tolist()
+    return [Line(start=start, end=end) for start, end in zip(points[:-1], points[1:])
+            if start != end]
+
+
+def split_segments(path, clip, tolerance):
+    """
+    split each continuous subpath of a svgpathtools path where it crosses the edges of a
+    convex polygon, returning a list of (pieces, inside) for each subpath: its segments in
+    order, cropped at the crossings, and whether each piece is inside the polygon.
+    Segments that don't cross an edge are kept as they are. The crossings are found with
+    intersect_lines, to within tolerance.
+    """
+    edges = list(convex_edges(clip))
+    starts, ends = np.array([a for a, _ in edges]), np.array([b for _, b in edges])
+    split = []
+    for subpath in path.continuous_subpaths():
+        _, segments, ts = intersect_lines(subpath, starts, ends, tolerance)
+        pieces = []
+        for i, segment in enumerate(subpath):
+            cuts = ts[(segments == i) & (ts > 1e-9) & (ts < 1 - 1e-9)]
+            if len(cuts) == 0:
+                pieces.append(segment)
+                continue
+            bounds = [0.0] + sorted(set(cuts.tolist())) + [1.0]
+            pieces += [segment.cropped(t0, t1) for t0, t1 in zip(bounds[:-1], bounds[1:])]
+        middles = np.array([piece.point(0.5) for piece in pieces])
+        split.append((pieces, inside_convex(middles, clip)))
+    return split
+
+
+def clip_stroke(split):
+    # the pieces of a path split by split_segments that are inside the polygon, for stroking
+    return Path(*[piece for pieces, inside in split
+                  for piece, keep in zip(pieces, inside) if keep])
+
+
+def boundary_arc(clip, start, end, forward=True):
+    """
+    the points along the edges of a polygon from start to end, two points on its edges,
+    going forward or backward around it
+    """
+    directions = np.roll(clip, -1) - clip
+    lengths = np.abs(directions)
+    # how far around the polygon each corner, and each point, is
+    corners = np.cumsum(lengths) - lengths
+    total = lengths.sum()
+
+    def around(point):
+        ts = np.clip(((point - clip) * directions.conjugate()).real / lengths ** 2, 0, 1)
+        edge = np.argmin(np.abs(clip + ts * directions - point))
+        return corners[edge] + ts[edge] * lengths[edge]
+    sign = 1 if forward else -1
+    offsets = (sign * (corners - around(start))) % total
+    span = (sign * (around(end) - around(start))) % total
+    passed = np.flatnonzero((offsets > 0) & (offsets < span))
+    return np.concatenate([[start], clip[passed[np.argsort(offsets[passed])]], [end]])
+
+
+def clip_area(split, clip, tolerance):
+    """
+    the part of the area of a path split by split_segments that is inside the convex
+    polygon clip, as a path. The pieces inside are kept as they are, and each run of
+    pieces outside is replaced by the polygon's edges between where it leaves and where
+    it comes back in, going the same way around the polygon as the run does.
+    """
+    centre = clip.mean()
+    if cross(clip, np.roll(clip, -1)).sum() < 0:
+        clip = clip[::-1]
+    segments = []
+    for pieces, inside in split:
+        if inside.all():
+            segments += pieces
+            continue
+        if not inside.any():
+            # a subpath that is all outside covers the whole polygon if it goes around it
+            points = np.concatenate([flatten_segment(piece, tolerance) for piece in pieces])
+            winding = winding_number(points, centre)
+            if winding != 0:
+                loop = clip if winding > 0 else clip[::-1]
+                segments += polyline_lines(np.append(loop, loop[0]))
+            continue
+        # start from a piece that comes back inside, so that no run outside wraps around
+        first = np.flatnonzero(inside & ~np.roll(inside, 1))[0]
+        pieces, inside = pieces[first:] + pieces[:first], np.roll(inside, -first)
+        outside = []
+        for piece, keep in list(zip(pieces, inside)) + [(None, True)]:
+            if not keep:
+                outside.append(piece)
+                continue
+            if outside:
+                run = np.concatenate([flatten_segment(piece, tolerance) for piece in outside])
+                arc = boundary_arc(clip, run[0], run[-1])
+                if winding_number(np.concatenate([run, arc[::-1]]), centre) != 0:
+                    arc = boundary_arc(clip, run[0], run[-1], forward=False)
+                segments += polyline_lines(arc)
+                outside = []
+            if piece is not None:
+                segments.append(piece)
+    return Path(*segments)
 
 
 def get_paletton(filename):